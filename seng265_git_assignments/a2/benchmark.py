@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for song_analyzer.py.
+Sample input: --data="data.csv" --repeat="1000"
+@author: Wesley Ducharme
+@author: V00974267
+"""
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from typing import Callable, List, Optional
+
+import song_analyzer
+import song_cache
+
+
+def parse_command_line_args() -> argparse.Namespace:
+    """Parse command line arguments.
+            Parameters
+            ----------
+                None
+            Returns
+            -------
+                argparse.Namespace
+                    The Arguements from the command line and their values.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark song_analyzer.py')
+    parser.add_argument('--data', default='data.csv', help='csv file to read')
+    parser.add_argument('--repeat', type=int, default=1000, help='number of copies of the data to benchmark on')
+    return parser.parse_args()
+
+
+def make_release_date_column_per_row(df: pd.DataFrame) -> pd.DataFrame:
+    """The original per row release date column, kept as the baseline of the benchmark.
+            Parameters
+            ----------
+                df : pd.DataFrame, required
+                    The pandas dataframe that the column will be added to.
+            Returns
+            -------
+                pd.DataFrame
+                    The pandas dataframe with the added column.
+    """
+    df = df.copy()
+    df["released"] = df.apply(lambda row: datetime(row["released_year"], row["released_month"], row["released_day"])
+                              .strftime("%a, %B %d, %Y"), axis=1)
+    df.insert(0, "released", df.pop("released"))
+    return df
+
+
+def rows_per_second(function: Callable[[pd.DataFrame], pd.DataFrame], df: pd.DataFrame) -> tuple:
+    """Times one call of a function on a dataframe.
+            Parameters
+            ----------
+                function : Callable[[pd.DataFrame], pd.DataFrame], required
+                    The function to time.
+                df : pd.DataFrame, required
+                    The dataframe to pass to the function.
+            Returns
+            -------
+                tuple
+                    The number of rows handled per second and the dataframe the function returned.
+    """
+    start: float = time.perf_counter()
+    result: pd.DataFrame = function(df)
+    elapsed: float = time.perf_counter() - start
+    return len(df) / elapsed, result
+
+
+def benchmark_release_date_column(df: pd.DataFrame) -> None:
+    """Compares the per row and the vectorized release date columns and prints their throughput.
+            Parameters
+            ----------
+                df : pd.DataFrame, required
+                    The song data to benchmark on.
+            Returns
+            -------
+                None
+    """
+    before, expected = rows_per_second(make_release_date_column_per_row, df)
+    after, result = rows_per_second(song_analyzer.make_release_date_column, df)
+    if not result["released"].equals(expected["released"]):
+        raise AssertionError("the vectorized release dates differ from the per row release dates")
+    print(f'make_release_date_column ({len(df)} rows)')
+    print(f'    per row:    {before:14,.0f} rows/s')
+    print(f'    vectorized: {after:14,.0f} rows/s ({after / before:.1f}x)')
+
+
+def benchmark_leaderboards(path: str, limit: int = 20) -> None:
+    """Checks the materialized leaderboards against the sort path for every order_by field, order and year, and
+    prints the time both take.
+            Parameters
+            ----------
+                path : str, required
+                    The csv file of song data to benchmark on.
+                limit : int
+                    The number of rows of every query. Default value is 20.
+            Returns
+            -------
+                None
+    """
+    song_cache.materialize_leaderboards(path, list(song_analyzer.ORDER_BY_COLUMNS.values()))
+    df: pd.DataFrame = song_cache.read_songs(path)
+    years: List[Optional[int]] = [None] + sorted(df["released_year"].unique().tolist())
+    sort_time: float = 0.0
+    slice_time: float = 0.0
+    for column in song_analyzer.ORDER_BY_COLUMNS.values():
+        for ascending in (True, False):
+            for year in years:
+                start: float = time.perf_counter()
+                filtered_df: pd.DataFrame = df if year is None else df[df["released_year"] == year]
+                expected: np.ndarray = song_analyzer.sort_rows(filtered_df, column, ascending, limit).index.to_numpy()
+                sort_time += time.perf_counter() - start
+                start = time.perf_counter()
+                rows: Optional[np.ndarray] = song_cache.find_leaderboard_rows(path, column, ascending, year, limit)
+                slice_time += time.perf_counter() - start
+                if rows is None or not np.array_equal(rows, expected):
+                    raise AssertionError(f'the leaderboard of {column} (ascending={ascending}, year={year}) differs from the sort')
+    queries: int = len(song_analyzer.ORDER_BY_COLUMNS) * 2 * len(years)
+    print(f'leaderboards ({len(df)} rows, {queries} queries with limit {limit})')
+    print(f'    sort:  {sort_time / queries * 1000:10.3f} ms/query')
+    print(f'    slice: {slice_time / queries * 1000:10.3f} ms/query ({sort_time / slice_time:.1f}x)')
+
+
+def main() -> None:
+    """Main entry point of the program."""
+    args: argparse.Namespace = parse_command_line_args()
+    df: pd.DataFrame = pd.concat([pd.read_csv(args.data)] * args.repeat, ignore_index=True)
+    benchmark_release_date_column(df)
+    with tempfile.TemporaryDirectory() as tmp_dir:  #the leaderboards are stored next to the csv file they rank
+        path: str = os.path.join(tmp_dir, "data.csv")
+        df.to_csv(path, index=False)
+        benchmark_leaderboards(path)
+
+if __name__ == '__main__':
+    main()
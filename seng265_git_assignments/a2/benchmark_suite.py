@@ -0,0 +1,343 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite for song_analyzer.py on synthetic song data.
+Synthetic csv files with the columns of data.csv are generated at every size, with artists drawn from a Zipf-like
+distribution (the most streamed real artists first) and release years drawn from the years of data.csv, which are
+mostly recent. The five reference queries of TESTS.md and random queries are then run through the command line, each in
+its own process, and their latency percentiles, throughput and peak RSS are reported.
+Sample input: --sizes="10K,1M" --runs="5" --random="20" --results="bench.json" --baseline="last_bench.json"
+@author: Wesley Ducharme
+@author: V00974267
+"""
+import argparse
+import calendar
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional
+
+
+SONG_ANALYZER: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "song_analyzer.py")
+SIZE_SUFFIXES: Dict[str, int] = {"K": 1000, "M": 1000 * 1000}
+GENERATE_CHUNK_ROWS: int = 1000 * 1000
+ARTIST_SKEW: float = 1.07  #Zipf exponent of the artist popularity
+COLLABORATION_RATE: float = 0.25
+ROWS_PER_ARTIST: int = 50
+PERCENTILES: List[int] = [50, 90, 99]
+REFERENCE_QUERIES: Dict[str, List[str]] = {
+    "test01": ["--filter=ARTIST", "--value=Dua Lipa", "--order_by=STREAMS", "--order=ASC", "--limit=6"],
+    "test02": ["--filter=ARTIST", "--value=Drake", "--order_by=STREAMS", "--order=DES"],
+    "test03": ["--order_by=STREAMS", "--order=DES", "--limit=20"],
+    "test04": ["--filter=YEAR", "--value=2023", "--order_by=NO_SPOTIFY_PLAYLISTS", "--order=DES", "--limit=5"],
+    "test05": ["--filter=YEAR", "--value=2023", "--order_by=NO_APPLE_PLAYLISTS", "--order=DES", "--limit=7"],
+}
+
+
+def parse_command_line_args() -> argparse.Namespace:
+    """Parse command line arguments.
+            Parameters
+            ----------
+                None
+            Returns
+            -------
+                argparse.Namespace
+                    The Arguements from the command line and their values.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark song_analyzer.py on synthetic song data')
+    parser.add_argument('--data', default='data.csv', help='csv file the synthetic data imitates')
+    parser.add_argument('--sizes', default='10K,1M,10M', help='comma separated numbers of rows, with K or M suffixes')
+    parser.add_argument('--runs', type=int, default=5, help='number of runs of every reference query')
+    parser.add_argument('--random', type=int, default=20, help='number of random queries, each run once')
+    parser.add_argument('--seed', type=int, default=265, help='seed of the synthetic data and of the random queries')
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'song_benchmark'),
+                        help='directory the synthetic csv files are kept in between runs')
+    parser.add_argument('--generate_only', action='store_true', help='only generate the synthetic csv files')
+    parser.add_argument('--results', help='json file to write the results to')
+    parser.add_argument('--baseline', help='json results of an earlier run to compare the median latencies with')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='fraction a median latency may grow over the baseline before it counts as a regression')
+    return parser.parse_args()
+
+
+def parse_size(size: str) -> int:
+    """Converts a size like 10K or 1M to a number of rows"""
+    size = size.strip().upper()
+    if size[-1] in SIZE_SUFFIXES:
+        return int(float(size[:-1]) * SIZE_SUFFIXES[size[-1]])
+    return int(size)
+
+
+def artist_pool(df: pd.DataFrame, rows: int) -> tuple:
+    """Makes the artists of the synthetic data: the artists of data.csv from most to least frequent, followed by made up
+    artists so there are about ROWS_PER_ARTIST rows per artist, with Zipf-like weights.
+            Parameters
+            ----------
+                df : pd.DataFrame, required
+                    The data the synthetic data imitates.
+                rows : int, required
+                    The number of rows of the synthetic data.
+            Returns
+            -------
+                tuple
+                    The artist names, their artist_count and the probability of drawing each of them.
+    """
+    counts: pd.DataFrame = df.groupby("artist(s)_name").agg(rows=("artist_count", "size"), artist_count=("artist_count", "first"))
+    counts = counts.sort_values("rows", ascending=False, kind="stable")
+    made_up: int = max(rows // ROWS_PER_ARTIST - len(counts), 0)
+    names: np.ndarray = np.concatenate([counts.index.to_numpy(dtype=object),
+                                        np.array([f"Artist {number:06d}" for number in range(made_up)], dtype=object)])
+    artist_counts: np.ndarray = np.concatenate([counts["artist_count"].to_numpy(), np.ones(made_up, dtype=np.int64)])
+    weights: np.ndarray = 1 / np.arange(1, len(names) + 1) ** ARTIST_SKEW
+    return names, artist_counts, weights / weights.sum()
+
+
+def generate_chunk(df: pd.DataFrame, pool: tuple, rows: int, rng: np.random.Generator) -> pd.DataFrame:
+    """Generates rows of synthetic song data.
+            Parameters
+            ----------
+                df : pd.DataFrame, required
+                    The data the synthetic data imitates.
+                pool : tuple, required
+                    The artist names, artist counts and weights from artist_pool().
+                rows : int, required
+                    The number of rows to generate.
+                rng : np.random.Generator, required
+                    The random number generator.
+            Returns
+            -------
+                pd.DataFrame
+                    The rows, with the same columns as data.csv.
+    """
+    names, artist_counts, weights = pool
+    first: np.ndarray = rng.choice(len(names), size=rows, p=weights)
+    second: np.ndarray = rng.choice(len(names), size=rows, p=weights)
+    collaboration: np.ndarray = rng.random(rows) < COLLABORATION_RATE
+    artists: np.ndarray = np.where(collaboration, names[first] + " " + names[second], names[first])
+
+    years_seen: pd.Series = df["released_year"].value_counts(normalize=True)
+    years: np.ndarray = rng.choice(years_seen.index.to_numpy(), size=rows, p=years_seen.to_numpy())
+    months: np.ndarray = rng.integers(1, 13, size=rows)
+    month_days: np.ndarray = np.array([calendar.monthrange(2001, month)[1] for month in range(1, 13)])[months - 1]
+    leap_february: np.ndarray = (months == 2) & np.array([calendar.isleap(year) for year in range(4000)])[years]
+    days: np.ndarray = (rng.random(rows) * (month_days + leap_february)).astype(np.int64) + 1
+
+    popularity: np.ndarray = rng.standard_normal(rows)  #streams and playlist counts rise and fall together
+    def popular(median: float, low: float, high: float) -> np.ndarray:
+        """Draws a lognormal count around a median that follows the popularity of the song"""
+        noise: np.ndarray = 0.8 * popularity + 0.6 * rng.standard_normal(rows)
+        return np.clip(np.round(median * np.exp(noise)), low, high).astype(np.int64)
+
+    keys_seen: pd.Series = df["key"].value_counts(normalize=True, dropna=False)
+    tracks: np.ndarray = df["track_name"].dropna().to_numpy(dtype=object)
+    return pd.DataFrame({
+        "track_name": tracks[rng.integers(0, len(tracks), size=rows)],
+        "artist(s)_name": artists,
+        "artist_count": np.where(collaboration, artist_counts[first] + artist_counts[second], artist_counts[first]),
+        "released_year": years,
+        "released_month": months,
+        "released_day": days,
+        "in_spotify_playlists": popular(2216, 31, 52898),
+        "streams": np.clip(np.round(2.9e8 * np.exp(1.1 * popularity)), 2762, 3.7e9).astype(np.int64),
+        "in_apple_playlists": popular(34, 0, 672),
+        "bpm": np.clip(np.round(rng.normal(122, 28, size=rows)), 65, 206).astype(np.int64),
+        "key": rng.choice(keys_seen.index.to_numpy(dtype=object), size=rows, p=keys_seen.to_numpy()),
+        "mode": np.where(rng.random(rows) < 0.58, "Major", "Minor"),
+        "danceability_%": np.clip(np.round(rng.normal(67, 15, size=rows)), 23, 96).astype(np.int64),
+    }, columns=df.columns)
+
+
+def generate_songs(df: pd.DataFrame, path: str, rows: int, seed: int) -> None:
+    """Writes a synthetic csv file of song data, a chunk of rows at a time so memory use does not grow with its size.
+            Parameters
+            ----------
+                df : pd.DataFrame, required
+                    The data the synthetic data imitates.
+                path : str, required
+                    The csv file to write.
+                rows : int, required
+                    The number of rows to write.
+                seed : int, required
+                    The seed of the random number generator, the same seed always writes the same file.
+            Returns
+            -------
+                None
+    """
+    rng: np.random.Generator = np.random.default_rng(seed)
+    pool: tuple = artist_pool(df, rows)
+    tmp_path: str = path + ".tmp"
+    with open(tmp_path, "w", newline="") as file_out:
+        for start in range(0, rows, GENERATE_CHUNK_ROWS):
+            chunk: pd.DataFrame = generate_chunk(df, pool, min(GENERATE_CHUNK_ROWS, rows - start), rng)
+            chunk.to_csv(file_out, index=False, header=start == 0)
+    os.replace(tmp_path, path)  #an interrupted run never leaves a partial file to be reused
+
+
+def random_queries(df: pd.DataFrame, count: int, rng: np.random.Generator) -> Dict[str, List[str]]:
+    """Makes random queries over the artists and years of the data, weighted like the synthetic data.
+            Parameters
+            ----------
+                df : pd.DataFrame, required
+                    The data the synthetic data imitates.
+                count : int, required
+                    The number of queries.
+                rng : np.random.Generator, required
+                    The random number generator.
+            Returns
+            -------
+                Dict[str, List[str]]
+                    The arguements of every query by name.
+    """
+    artists: np.ndarray = df["artist(s)_name"].value_counts().index.to_numpy(dtype=object)[:50]
+    years: np.ndarray = df["released_year"].to_numpy()
+    queries: Dict[str, List[str]] = {}
+    for number in range(count):
+        argv: List[str] = []
+        kind: str = rng.choice(["none", "ARTIST", "YEAR"])
+        if kind == "ARTIST":
+            argv += ["--filter=ARTIST", f'--value={rng.choice(artists)}']
+        elif kind == "YEAR":
+            argv += ["--filter=YEAR", f'--value={rng.choice(years)}']
+        argv += [f'--order_by={rng.choice(["STREAMS", "NO_SPOTIFY_PLAYLISTS", "NO_APPLE_PLAYLISTS"])}',
+                 f'--order={rng.choice(["ASC", "DES"])}']
+        limit: int = int(rng.choice([0, 5, 20, 100]))
+        if limit > 0 or kind == "none":  #a query without a filter or a limit writes the whole file
+            argv.append(f'--limit={limit or 20}')
+        queries[f'random{number:02d}'] = argv
+    return queries
+
+
+def run_query(path: str, argv: List[str]) -> dict:
+    """Runs one query through the command line in a new process, the way it is run in production.
+            Parameters
+            ----------
+                path : str, required
+                    The csv file to query.
+                argv : List[str], required
+                    The arguements of the query.
+            Returns
+            -------
+                dict
+                    The latency in seconds and the --profile_json report of the run, which holds its peak RSS.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        profile_path: str = os.path.join(tmp_dir, "profile.json")
+        command: List[str] = [sys.executable, SONG_ANALYZER, f'--data={path}', *argv, f'--output={os.devnull}',
+                              "--cache_size=0", f'--profile_json={profile_path}']  #the result cache would hide the work
+        start: float = time.perf_counter()
+        subprocess.run(command, check=True, stderr=subprocess.DEVNULL)
+        latency: float = time.perf_counter() - start
+        with open(profile_path, "r") as file_in:
+            return {"latency": latency, "profile": json.load(file_in)}
+
+
+def summarize(latencies: List[float], rss: List[int], rows: int) -> dict:
+    """Computes the latency percentiles, throughput and peak RSS of the runs of a query"""
+    summary: dict = {f'p{percentile}_ms': float(np.percentile(latencies, percentile)) * 1000 for percentile in PERCENTILES}
+    summary["max_ms"] = max(latencies) * 1000
+    summary["rows_per_second"] = rows / float(np.median(latencies))
+    summary["peak_rss_mib"] = max(rss) / 2 ** 20
+    summary["runs"] = len(latencies)
+    return summary
+
+
+def benchmark_size(df: pd.DataFrame, path: str, rows: int, args: argparse.Namespace) -> Dict[str, dict]:
+    """Runs the reference and random queries on one synthetic csv file and prints their results.
+            Parameters
+            ----------
+                df : pd.DataFrame, required
+                    The data the synthetic data imitates.
+                path : str, required
+                    The synthetic csv file.
+                rows : int, required
+                    The number of rows of the file.
+                args : argparse.Namespace, required
+                    The arguements of the benchmark.
+            Returns
+            -------
+                Dict[str, dict]
+                    The summary of every query by name, and of the first run, which builds the columnar cache of a new file. Every
+                    reference query is run once before the timed runs.
+    """
+    results: Dict[str, dict] = {}
+    first: dict = run_query(path, REFERENCE_QUERIES["test03"])
+    results["cold"] = summarize([first["latency"]], [first["profile"]["max_rss_bytes"] or 0], rows)
+    for argv in REFERENCE_QUERIES.values():  #the artist index and year partitions are built by the first queries using them
+        run_query(path, argv)
+
+    for name, argv in REFERENCE_QUERIES.items():
+        runs: List[dict] = [run_query(path, argv) for _ in range(args.runs)]
+        results[name] = summarize([run["latency"] for run in runs], [run["profile"]["max_rss_bytes"] or 0 for run in runs], rows)
+
+    random_runs: List[dict] = [run_query(path, argv) for argv in random_queries(df, args.random, np.random.default_rng(args.seed)).values()]
+    if random_runs:
+        results["random"] = summarize([run["latency"] for run in random_runs],
+                                      [run["profile"]["max_rss_bytes"] or 0 for run in random_runs], rows)
+
+    print(f'{rows:,} rows ({os.path.getsize(path) / 2 ** 20:,.1f} MiB)')
+    print(f'    {"query":<10}{"runs":>6}{"p50 ms":>10}{"p90 ms":>10}{"p99 ms":>10}{"max ms":>10}{"rows/s":>16}{"peak RSS MiB":>14}')
+    for name, summary in results.items():
+        print(f'    {name:<10}{summary["runs"]:>6}{summary["p50_ms"]:>10.1f}{summary["p90_ms"]:>10.1f}{summary["p99_ms"]:>10.1f}'
+              f'{summary["max_ms"]:>10.1f}{summary["rows_per_second"]:>16,.0f}{summary["peak_rss_mib"]:>14.1f}')
+    return results
+
+
+def compare_with_baseline(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """Finds the queries whose median latency grew by more than the tolerance since the baseline.
+            Parameters
+            ----------
+                results : Dict[str, dict]
+                    The results of this run by size and query.
+                baseline : Dict[str, dict]
+                    The results of an earlier run by size and query.
+                tolerance : float
+                    The fraction the median latency may grow by.
+            Returns
+            -------
+                List[str]
+                    A description of every regression.
+    """
+    regressions: List[str] = []
+    for size, queries in results.items():
+        for name, summary in queries.items():
+            before: Optional[dict] = baseline.get(size, {}).get(name)
+            if before is not None and summary["p50_ms"] > before["p50_ms"] * (1 + tolerance):
+                regressions.append(f'{size} {name}: p50 {before["p50_ms"]:.1f} ms -> {summary["p50_ms"]:.1f} ms')
+    return regressions
+
+
+def main() -> None:
+    """Main entry point of the program."""
+    args: argparse.Namespace = parse_command_line_args()
+    df: pd.DataFrame = pd.read_csv(args.data)
+    os.makedirs(args.workdir, exist_ok=True)
+
+    results: Dict[str, Dict[str, dict]] = {}
+    for size in args.sizes.split(","):
+        rows: int = parse_size(size)
+        path: str = os.path.join(args.workdir, f'songs_{rows}_seed{args.seed}.csv')
+        if not os.path.exists(path):  #generated files are reused, the same seed always generates the same file
+            start: float = time.perf_counter()
+            generate_songs(df, path, rows, args.seed)
+            print(f'generated {path} in {time.perf_counter() - start:.1f} s')
+        if not args.generate_only:
+            results[size.strip().upper()] = benchmark_size(df, path, rows, args)
+
+    if args.results != None:
+        with open(args.results, "w") as file_out:
+            json.dump(results, file_out, indent=2)
+    if args.baseline != None:
+        with open(args.baseline, "r") as file_in:
+            regressions: List[str] = compare_with_baseline(results, json.load(file_in), args.tolerance)
+        for regression in regressions:
+            print(f'regression: {regression}')
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Binary columnar output for song_analyzer.py --output_format.
+The result of a query can be written as Parquet, an Arrow IPC stream or a Feather (Arrow IPC file) file instead of csv,
+with the same columns as the csv output: released, track_name and artist(s)_name as strings and the order_by column as
+64 bit integers (or floats if it has missing values), so the result is read back typed and without parsing any text.
+Missing text values, which the csv output writes as empty fields, are nulls.
+These formats need the pyarrow package, which is imported only when one of them is asked for.
+@author: Wesley Ducharme
+@author: V00974267
+"""
+from __future__ import annotations
+
+import contextlib
+import itertools
+import os
+import sys
+from typing import IO, TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional
+
+if TYPE_CHECKING:
+    import pandas as pd
+    import pyarrow as pa
+
+
+FORMATS: List[str] = ["csv", "parquet", "arrow", "feather"]
+FORMAT_SUFFIXES: Dict[str, str] = {".parquet": "parquet", ".arrow": "arrow", ".arrows": "arrow", ".feather": "feather"}
+IPC_COMPRESSIONS: List[str] = ["zstd"]  #lz4 is the only other codec of Arrow IPC, gzip is not one
+BATCH_ROWS: int = 50000
+
+
+def output_format_for(file_name: str, output_format: Optional[str] = None) -> str:
+    """Picks the format of the output of a query.
+            Parameters
+            ----------
+                file_name : str, required
+                    The name of the file to write to, or - for stdout.
+                output_format : str, optional
+                    One of FORMATS. Default value is None which picks the format from the suffix of file_name.
+            Returns
+            -------
+                str
+                    The format, csv unless it is asked for or file_name ends in .parquet, .arrow, .arrows or .feather.
+    """
+    if output_format != None:
+        return output_format
+    return FORMAT_SUFFIXES.get(os.path.splitext(file_name)[1].lower(), "csv")
+
+
+def suffix_for(output_format: str) -> str:
+    """Returns the file name suffix of a format, .csv for csv."""
+    return next((suffix for suffix, name in FORMAT_SUFFIXES.items() if name == output_format), ".csv")
+
+
+def import_pyarrow():
+    """Imports pyarrow, explaining how to install it if it is missing."""
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError('parquet, arrow and feather output need the pyarrow package (pip install pyarrow)') from None
+    return pyarrow
+
+
+def output_schema(header: List[str], float_values: bool = False) -> pa.Schema:
+    """Makes the schema of the output of a query.
+            Parameters
+            ----------
+                header : List[str], required
+                    The column names, the text columns first and the order_by column last.
+                float_values : bool, optional
+                    True if the order_by column holds floats, as pandas reads a column with missing numbers. Default
+                    value is False.
+            Returns
+            -------
+                pa.Schema
+                    The schema.
+    """
+    pa = import_pyarrow()
+    return pa.schema([(name, pa.string()) for name in header[:-1]] + [(header[-1], pa.float64() if float_values else pa.int64())])
+
+
+def df_to_table(df: pd.DataFrame, schema: pa.Schema) -> pa.Table:
+    """Converts the dataframe of a query result to an arrow table with the output schema.
+            Parameters
+            ----------
+                df : pd.DataFrame, required
+                    The dataframe worked on, with the columns of the schema.
+                schema : pa.Schema, required
+                    The schema from output_schema().
+            Returns
+            -------
+                pa.Table
+                    The table. Categorical and compact integer columns are converted to plain strings and 64 bit numbers.
+    """
+    import numpy as np
+    pa = import_pyarrow()
+
+    arrays: List[pa.Array] = []
+    for field in schema:
+        values: object = df[field.name].to_numpy()
+        if pa.types.is_string(field.type):
+            values = np.asarray(df[field.name], dtype=object)  #categories become their values, NaN becomes null below
+        arrays.append(pa.array(values, from_pandas=True).cast(field.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def rows_to_table(rows: List[list], schema: pa.Schema) -> pa.Table:
+    """Converts rows of a query result, as the csv module would write them, to an arrow table with the output schema.
+            Parameters
+            ----------
+                rows : List[list], required
+                    The rows, whose values are strings or numbers and "" for missing values.
+                schema : pa.Schema, required
+                    The schema from output_schema().
+            Returns
+            -------
+                pa.Table
+                    The table.
+    """
+    pa = import_pyarrow()
+    columns: List[tuple] = list(zip(*rows)) if rows else [() for _ in schema]
+    arrays: List[pa.Array] = [pa.array([None if value == "" else value for value in column]).cast(field.type)
+                              for field, column in zip(schema, columns)]  #numbers read as text are cast to the field type
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+@contextlib.contextmanager
+def open_table_writer(file_name: str, output_format: str, schema: pa.Schema, compression: Optional[str] = None) -> Iterator[object]:
+    """Opens the output of a query for writing arrow tables in a binary columnar format.
+            Parameters
+            ----------
+                file_name : str, required
+                    The name of the file to write to, or - for stdout.
+                output_format : str, required
+                    parquet, arrow or feather.
+                schema : pa.Schema, required
+                    The schema from output_schema().
+                compression : str, optional
+                    gzip or zstd for parquet, zstd for arrow and feather, applied to the column data inside the file.
+                    Default value is None which writes parquet with snappy and arrow and feather uncompressed.
+            Returns
+            -------
+                Iterator[object]
+                    The writer, whose write_table() appends the rows of a table. The file is finished when the with block
+                    ends.
+    """
+    pa = import_pyarrow()
+    sink: IO = sys.stdout.buffer if file_name == "-" else open(file_name, "wb")
+    if output_format == "parquet":
+        writer = pa.parquet.ParquetWriter(sink, schema, compression=compression or "snappy")
+    else:
+        options = pa.ipc.IpcWriteOptions(compression=compression)
+        new_writer = pa.ipc.new_stream if output_format == "arrow" else pa.ipc.new_file  #feather is the Arrow IPC file format
+        writer = new_writer(sink, schema, options=options)
+    try:
+        yield writer
+    finally:
+        writer.close()
+        if file_name == "-":
+            sink.flush()  #stdout is never closed
+        else:
+            sink.close()
+
+
+def write_df(df: pd.DataFrame, file_name: str, output_format: str, compression: Optional[str] = None) -> None:
+    """Writes the dataframe of a query result in a binary columnar format.
+            Parameters
+            ----------
+                df : pd.DataFrame, required
+                    The dataframe worked on, with the order_by column last.
+                file_name : str, required
+                    The name of the file to write to, or - for stdout.
+                output_format : str, required
+                    parquet, arrow or feather.
+                compression : str, optional
+                    The compression of the column data, see open_table_writer(). Default value is None.
+            Returns
+            -------
+                None
+    """
+    schema: pa.Schema = output_schema(list(df.columns), df[df.columns[-1]].dtype.kind == "f")
+    with open_table_writer(file_name, output_format, schema, compression) as writer:
+        writer.write_table(df_to_table(df, schema))
+
+
+def write_rows(header: List[str], rows: Iterable[list], file_name: str, output_format: str, compression: Optional[str] = None,
+               float_values: bool = False) -> None:
+    """Writes rows of a query result in a binary columnar format, converting BATCH_ROWS rows to a table at a time.
+            Parameters
+            ----------
+                header : List[str], required
+                    The column names, with the order_by column last.
+                rows : Iterable[list], required
+                    The rows to write, as the csv module would write them.
+                file_name : str, required
+                    The name of the file to write to, or - for stdout.
+                output_format : str, required
+                    parquet, arrow or feather.
+                compression : str, optional
+                    The compression of the column data, see open_table_writer(). Default value is None.
+                float_values : bool, optional
+                    True if the order_by values are floats. Default value is False.
+            Returns
+            -------
+                None
+    """
+    schema: pa.Schema = output_schema(header, float_values)
+    iterator: Iterator[list] = iter(rows)
+    with open_table_writer(file_name, output_format, schema, compression) as writer:
+        batch: List[list] = list(itertools.islice(iterator, BATCH_ROWS))
+        writer.write_table(rows_to_table(batch, schema))  #an empty result still writes its schema
+        while len(batch) == BATCH_ROWS:
+            batch = list(itertools.islice(iterator, BATCH_ROWS))
+            if batch:
+                writer.write_table(rows_to_table(batch, schema))
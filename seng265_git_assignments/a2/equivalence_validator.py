@@ -0,0 +1,346 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Equivalence checks for the query paths of song_analyzer.py.
+The fixture queries of the validator and a set of seeded random queries (filters, year and stream ranges, secondary
+sort keys, limits) are answered by every path of song_analyzer.py and each result is compared with a plain pandas
+reference: read the whole csv file, filter, stable sort, take the limit.
+The paths are the csv module for small inputs, the columnar cache with its artist index and year partitions (built on
+the first two thirds of the file and then extended by an append), chunked streaming, several files in a process pool,
+the result cache (a miss and then a hit), a batch file, the materialized leaderboards and the query server.
+Everything is written to a temporary directory, the data file and its caches are not touched.
+Sample input: python equivalence_validator.py --data="data.csv" --queries="40"
+@author: Wesley Ducharme
+@author: V00974267
+"""
+import argparse
+import contextlib
+import csv
+import io
+import os
+import random
+import shlex
+import sys
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer
+from typing import Callable, List, Optional, Tuple
+
+import pandas as pd
+
+import song_analyzer
+import song_cache
+import song_server
+
+
+VALIDATOR_NAME: str = "equivalence_validator"
+FIXTURE_QUERIES: List[List[str]] = [
+    ["--filter=ARTIST", "--value=Dua Lipa", "--order_by=STREAMS", "--order=ASC", "--limit=6"],
+    ["--filter=ARTIST", "--value=Drake", "--order_by=STREAMS", "--order=DES"],
+    ["--order_by=STREAMS", "--order=DES", "--limit=20"],
+    ["--filter=YEAR", "--value=2023", "--order_by=NO_SPOTIFY_PLAYLISTS", "--order=DES", "--limit=5"],
+    ["--filter=YEAR", "--value=2023", "--order_by=NO_APPLE_PLAYLISTS", "--order=DES", "--limit=7"]]
+ARTISTS: List[str] = ["Drake", "Dua Lipa", "Taylor Swift", "Bad Bunny", "The Weeknd", "Kook", "a", "zz"]
+YEARS: List[int] = [1999, 2019, 2022, 2023]
+CHUNKSIZE: int = 100
+PARTS: int = 3
+
+
+def parse_command_line_args() -> argparse.Namespace:
+    """Parse command line arguments.
+            Returns
+            -------
+                argparse.Namespace
+                    The Arguements from the command line and their values.
+    """
+    parser = argparse.ArgumentParser(description='Check that every query path of song_analyzer.py gives the same rows')
+    parser.add_argument('--data', default='data.csv', help='csv file to query (default: data.csv, which is also checked against test0*.csv)')
+    parser.add_argument('--queries', type=int, default=40, help='number of random queries (default: 40)')
+    parser.add_argument('--seed', type=int, default=265, help='seed of the random queries (default: 265)')
+    return parser.parse_args()
+
+
+def print_message(is_error: bool, message: str) -> None:
+    """Prints a message to stdout.
+            Parameters
+            ----------
+                is_error : bool, required
+                    Indicates whether the message is an error.
+                message : str, required
+                    The message to be printed out.
+    """
+    message_type: str = 'ERROR' if is_error else 'INFO'
+    print(f'[{VALIDATOR_NAME}] ({message_type}): {message}', flush=True)
+
+
+def random_queries(number: int, seed: int) -> List[List[str]]:
+    """Makes random queries using every filter and sort arguement of song_analyzer.py.
+            Parameters
+            ----------
+                number : int, required
+                    The number of queries.
+                seed : int, required
+                    The seed of the random generator.
+            Returns
+            -------
+                List[List[str]]
+                    The arguements of every query, without --data and --output.
+    """
+    rng: random.Random = random.Random(seed)
+    fields: List[str] = list(song_analyzer.ORDER_BY_COLUMNS)
+    queries: List[List[str]] = []
+    for _ in range(number):
+        argv: List[str] = [f'--order_by={rng.choice(fields)}', f'--order={rng.choice(["ASC", "DES"])}']
+        kind: Optional[str] = rng.choice(["ARTIST", "YEAR", None])
+        if kind == "ARTIST":
+            argv += ["--filter=ARTIST", f'--value={rng.choice(ARTISTS)}']
+        elif kind == "YEAR":
+            argv += ["--filter=YEAR", f'--value={rng.choice(YEARS)}']
+        if kind != "ARTIST" and rng.random() < 0.3:
+            argv.append(f'--artist={rng.choice(ARTISTS)}')
+        if rng.random() < 0.3:
+            argv.append(f'--min_year={rng.choice([1990, 2015, 2020])}')
+        if rng.random() < 0.2:
+            argv.append(f'--max_year={rng.choice([2018, 2022])}')
+        if rng.random() < 0.3:
+            argv.append(f'--min_streams={rng.choice([10 ** 7, 10 ** 8, 5 * 10 ** 8])}')
+        if rng.random() < 0.3:
+            argv.append(f'--then_by={rng.choice(fields)}{rng.choice(["", ":ASC", ":DES"])}')
+        limit: Optional[int] = rng.choice([None, 1, 5, 20, 300])
+        if limit != None:
+            argv.append(f'--limit={limit}')
+        queries.append(argv)
+    return queries
+
+
+def reference_rows(df: pd.DataFrame, argv: List[str]) -> List[list]:
+    """Answers a query with plain pandas on the whole csv file.
+            Parameters
+            ----------
+                df : pd.DataFrame, required
+                    Every row of the csv file, as read by pd.read_csv.
+                argv : List[str], required
+                    The arguements of the query.
+            Returns
+            -------
+                List[list]
+                    The rows of the expected output, header first, as the csv module reads them.
+    """
+    plan: song_analyzer.QueryPlan = song_analyzer.make_query_plan(song_analyzer.parse_command_line_args(argv))
+    if plan.artist != None:
+        df = df[df["artist(s)_name"].str.contains(plan.artist, na=False)]
+    if plan.year != None:
+        df = df[df["released_year"] == plan.year]
+    if plan.min_year != None:
+        df = df[df["released_year"] >= plan.min_year]
+    if plan.max_year != None:
+        df = df[df["released_year"] <= plan.max_year]
+    if plan.min_streams != None:
+        df = df[df["streams"] >= plan.min_streams]
+    keys: List[tuple] = plan.sort_keys()
+    df = df.sort_values([column for column, _ in keys], ascending=[ascending for _, ascending in keys], kind="stable")
+    if plan.limit != None:
+        df = df.head(plan.limit)
+    df = song_analyzer.drop_columns(plan.order_by, song_analyzer.make_release_date_column(df))
+    return list(csv.reader(io.StringIO(df.to_csv(index=False))))
+
+
+def read_rows(file_name: str) -> List[list]:
+    """Reads a csv output file as the csv module reads it."""
+    with open(file_name, "r", encoding="utf-8-sig", newline="") as file_in:
+        return list(csv.reader(file_in))
+
+
+def run_queries(queries: List[List[str]], data: str, directory: str, extra: List[str],
+                small_input_bytes: int = song_analyzer.SMALL_INPUT_BYTES) -> List[List[list]]:
+    """Runs queries through song_analyzer.process_data, as the command line would, and reads their output.
+            Parameters
+            ----------
+                queries : List[List[str]], required
+                    The arguements of every query.
+                data : str, required
+                    The --data of the queries.
+                directory : str, required
+                    The directory to write the output to.
+                extra : List[str], required
+                    Arguements added to every query to pick the path, e.g. --chunksize.
+                small_input_bytes : int, optional
+                    Inputs below this size are answered with the csv module, 0 to always use pandas. Default value is
+                    song_analyzer.SMALL_INPUT_BYTES.
+            Returns
+            -------
+                List[List[list]]
+                    The rows of the output of every query.
+    """
+    output: str = os.path.join(directory, "output.csv")
+    small: int = song_analyzer.SMALL_INPUT_BYTES
+    song_analyzer.SMALL_INPUT_BYTES = small_input_bytes
+    try:
+        results: List[List[list]] = []
+        for argv in queries:
+            song_analyzer.process_data(song_analyzer.parse_command_line_args([f'--data={data}'] + argv + extra + [f'--output={output}']))
+            results.append(read_rows(output))
+        return results
+    finally:
+        song_analyzer.SMALL_INPUT_BYTES = small
+
+
+def run_batch(queries: List[List[str]], data: str, directory: str) -> List[List[list]]:
+    """Runs queries as one batch file, with the --data of the command line.
+            Parameters
+            ----------
+                queries : List[List[str]], required
+                    The arguements of every query.
+                data : str, required
+                    The --data of the batch.
+                directory : str, required
+                    The directory to write the batch file and the output to.
+            Returns
+            -------
+                List[List[list]]
+                    The rows of the output of every query.
+    """
+    batch: str = os.path.join(directory, "batch.txt")
+    outputs: List[str] = [os.path.join(directory, f'batch{number}.csv') for number in range(len(queries))]
+    with open(batch, "w", encoding="utf-8") as file_out:
+        for argv, output in zip(queries, outputs):
+            file_out.write(shlex.join(argv + [f'--output={output}']) + "\n")
+    song_analyzer.process_data(song_analyzer.parse_command_line_args([f'--data={data}', f'--batch={batch}']))
+    return [read_rows(output) for output in outputs]
+
+
+def run_server(queries: List[List[str]], data: str, directory: str) -> List[List[list]]:
+    """Runs queries through a query server started on a free port of localhost.
+            Parameters
+            ----------
+                queries : List[List[str]], required
+                    The arguements of every query.
+                data : str, required
+                    The data the server loads.
+                directory : str, required
+                    The directory to write the output to.
+            Returns
+            -------
+                List[List[list]]
+                    The rows of the output of every query.
+    """
+    song_server.QueryHandler.songs = song_server.SongData(data)
+    server: ThreadingHTTPServer = ThreadingHTTPServer((song_server.HOST, 0), song_server.QueryHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    with contextlib.redirect_stderr(io.StringIO()):  #the latency log of every query, until the server is shut down
+        try:
+            return run_queries(queries, data, directory, [f'--server=http://{song_server.HOST}:{server.server_address[1]}'])
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+def split_lines(file_name: str) -> Tuple[bytes, List[bytes]]:
+    """Reads the header and the rows of a csv file whose rows are one line each."""
+    with open(file_name, "rb") as file_in:
+        lines: List[bytes] = file_in.read().splitlines(keepends=True)
+    return lines[0], lines[1:]
+
+
+def make_appended_copy(source: str, data: str) -> None:
+    """Copies a csv file in two steps, building the columnar cache, the artist index and the year partitions of the
+    first two thirds of its rows before appending the rest, so reading it extends the cache instead of rebuilding it.
+            Parameters
+            ----------
+                source : str, required
+                    The csv file to copy.
+                data : str, required
+                    The name of the copy.
+            Returns
+            -------
+                None
+    """
+    header, rows = split_lines(source)
+    cut: int = len(rows) * 2 // 3
+    with open(data, "wb") as file_out:
+        file_out.writelines([header] + rows[:cut])
+    song_cache.open_cache(data)
+    song_cache.find_artist_rows(data, ARTISTS[0])
+    song_cache.read_year_partition(data, YEARS[-1])
+    with open(data, "ab") as file_out:
+        file_out.writelines(rows[cut:])
+
+
+def make_parts(source: str, directory: str) -> str:
+    """Splits a csv file into PARTS csv files with the same header, in file order, and returns their directory."""
+    header, rows = split_lines(source)
+    parts: str = os.path.join(directory, "parts")
+    os.makedirs(parts)
+    size: int = -(-len(rows) // PARTS)
+    for number in range(PARTS):
+        with open(os.path.join(parts, f'part{number}.csv'), "wb") as file_out:
+            file_out.writelines([header] + rows[number * size:(number + 1) * size])
+    return parts
+
+
+def compare(name: str, queries: List[List[str]], expected: List[List[list]], results: List[List[list]]) -> bool:
+    """Compares the results of a path with the reference, reporting the first query that differs.
+            Parameters
+            ----------
+                name : str, required
+                    The name of the path.
+                queries : List[List[str]], required
+                    The arguements of every query.
+                expected : List[List[list]], required
+                    The reference rows of every query.
+                results : List[List[list]], required
+                    The rows the path gave for every query.
+            Returns
+            -------
+                bool
+                    True if every query gave the reference rows.
+    """
+    for argv, expected_rows, rows in zip(queries, expected, results):
+        if rows != expected_rows:
+            print_message(is_error=True, message=f'{name}: {shlex.join(argv)} gave other rows ({len(rows) - 1} rows, expected {len(expected_rows) - 1})')
+            return False
+    print_message(is_error=False, message=f'{name}: {len(queries)} queries PASSED')
+    return True
+
+
+def main() -> None:
+    """Main entry point of the program."""
+    args: argparse.Namespace = parse_command_line_args()
+    queries: List[List[str]] = FIXTURE_QUERIES + random_queries(args.queries, args.seed)
+    source_df: pd.DataFrame = pd.read_csv(args.data)
+    expected: List[List[list]] = [reference_rows(source_df, argv) for argv in queries]
+    passed: int = 0
+    checks: int = 0
+    if args.data == "data.csv":
+        checks += 1
+        fixtures: List[List[list]] = [read_rows(f'test0{number}.csv') for number in range(1, len(FIXTURE_QUERIES) + 1)]
+        passed += compare("reference against test0*.csv", FIXTURE_QUERIES, fixtures, expected[:len(FIXTURE_QUERIES)])
+
+    with tempfile.TemporaryDirectory() as directory:
+        data: str = os.path.join(directory, "data.csv")
+        make_appended_copy(args.data, data)
+        parts: str = make_parts(args.data, directory)
+        columns: List[str] = list(song_analyzer.ORDER_BY_COLUMNS.values())
+        paths: List[Tuple[str, Callable[[], List[List[list]]]]] = [
+            ("csv module", lambda: run_queries(queries, data, directory, ["--cache_size=0"])),
+            ("columnar cache, artist index and year partitions after an append",
+             lambda: run_queries(queries, data, directory, ["--cache_size=0"], 0)),
+            ("chunked streaming", lambda: run_queries(queries, data, directory, ["--cache_size=0", f'--chunksize={CHUNKSIZE}'], 0)),
+            ("several files", lambda: run_queries(queries, parts, directory, ["--cache_size=0"], 0)),
+            ("result cache miss", lambda: run_queries(queries, data, directory, [], 0)),
+            ("result cache hit", lambda: run_queries(queries, data, directory, [], 0)),
+            ("batch file", lambda: run_batch(queries, data, directory)),
+            ("materialized leaderboards",
+             lambda: song_cache.materialize_leaderboards(data, columns) or run_queries(queries, data, directory, ["--cache_size=0"], 0)),
+            ("query server", lambda: run_server(queries, data, directory))]
+        for name, run in paths:
+            checks += 1
+            passed += compare(name, queries, expected, run())
+
+    print_message(is_error=False, message=f'CHECKS PASSED: {passed}/{checks}')
+    if passed != checks:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Round trip checks for song_analyzer.py --output_format.
+Every fixture query of the validator is written as Parquet, an Arrow IPC stream and a Feather file, uncompressed and
+compressed with zstd, from memory and with chunked streaming, then read back with pyarrow and compared with its
+test0N.csv: the same header, the text columns as strings, the order_by column as 64 bit integers and the same rows in
+the same order. Needs the pyarrow package.
+Sample input: python format_validator.py
+@author: Wesley Ducharme
+@author: V00974267
+"""
+import csv
+import itertools
+import os
+import sys
+import tempfile
+from typing import List, Optional
+
+import columnar_output
+import song_analyzer
+
+
+VALIDATOR_NAME: str = "format_validator"
+FIXTURE_QUERIES: List[List[str]] = [
+    ["--filter=ARTIST", "--value=Dua Lipa", "--order_by=STREAMS", "--order=ASC", "--limit=6"],
+    ["--filter=ARTIST", "--value=Drake", "--order_by=STREAMS", "--order=DES"],
+    ["--order_by=STREAMS", "--order=DES", "--limit=20"],
+    ["--filter=YEAR", "--value=2023", "--order_by=NO_SPOTIFY_PLAYLISTS", "--order=DES", "--limit=5"],
+    ["--filter=YEAR", "--value=2023", "--order_by=NO_APPLE_PLAYLISTS", "--order=DES", "--limit=7"]]
+BINARY_FORMATS: List[str] = [name for name in columnar_output.FORMATS if name != "csv"]
+COMPRESSIONS: List[Optional[str]] = [None, "zstd"]
+PATHS: List[List[str]] = [[], ["--chunksize=100"]]
+
+
+def print_message(is_error: bool, message: str) -> None:
+    """Prints a message to stdout.
+            Parameters
+            ----------
+                is_error : bool, required
+                    Indicates whether the message is an error.
+                message : str, required
+                    The message to be printed out.
+    """
+    message_type: str = 'ERROR' if is_error else 'INFO'
+    print(f'[{VALIDATOR_NAME}] ({message_type}): {message}', flush=True)
+
+
+def read_back(file_name: str, output_format: str) -> List[list]:
+    """Reads a binary output file back with pyarrow.
+            Parameters
+            ----------
+                file_name : str, required
+                    The file written by song_analyzer.py.
+                output_format : str, required
+                    parquet, arrow or feather.
+            Returns
+            -------
+                List[list]
+                    The header and the rows, as the csv module would read them from the csv output, or an empty list if
+                    the columns do not have the output schema.
+    """
+    pa = columnar_output.import_pyarrow()
+    if output_format == "parquet":
+        table = pa.parquet.read_table(file_name)
+    elif output_format == "arrow":
+        with pa.OSFile(file_name, "rb") as file_in:
+            table = pa.ipc.open_stream(file_in).read_all()
+    else:
+        with pa.OSFile(file_name, "rb") as file_in:
+            table = pa.ipc.open_file(file_in).read_all()
+    if table.schema != columnar_output.output_schema(table.column_names):
+        print_message(is_error=True, message=f'{file_name} has the schema {table.schema.types}')
+        return []
+    return [table.column_names] + [["" if value is None else str(value) for value in row.values()] for row in table.to_pylist()]
+
+
+def main() -> None:
+    """Main entry point of the program."""
+    try:
+        columnar_output.import_pyarrow()
+    except ImportError as error:
+        print_message(is_error=True, message=str(error))
+        sys.exit(1)
+
+    passed: int = 0
+    checks: int = 0
+    with tempfile.TemporaryDirectory() as directory:
+        for number, argv in enumerate(FIXTURE_QUERIES, start=1):
+            with open(f'test0{number}.csv', "r", encoding="utf-8-sig", newline="") as file_in:
+                expected: List[list] = list(csv.reader(file_in))
+            for output_format, compression, path in itertools.product(BINARY_FORMATS, COMPRESSIONS, PATHS):
+                output: str = os.path.join(directory, f'output{columnar_output.suffix_for(output_format)}')
+                query: List[str] = ['--data=data.csv'] + argv + path + [f'--output={output}', f'--output_format={output_format}']
+                if compression != None:
+                    query.append(f'--compression={compression}')
+                song_analyzer.process_data(song_analyzer.parse_command_line_args(query))
+                checks += 1
+                if read_back(output, output_format) == expected:
+                    passed += 1
+                else:
+                    print_message(is_error=True, message=f'test0{number}.csv as {output_format} ({compression or "uncompressed"}'
+                                                         f'{", " + path[0] if path else ""}) differs')
+            print_message(is_error=False, message=f'|Test {number}| {len(BINARY_FORMATS) * len(COMPRESSIONS) * len(PATHS)} round trips done')
+
+    print_message(is_error=False, message=f'ROUND TRIPS PASSED: {passed}/{checks}')
+    if passed != checks:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+On disk result cache for song_analyzer.py.
+The csv output of every query is kept in .song_cache/results next to the data, named by a hash of the normalized query
+and the size and modification time of the data files, so a repeated query is answered by copying the file without
+importing pandas. The least recently used results are removed when the cache grows past its size cap.
+Only the standard library is used here, importing this module must stay cheap.
+@author: Wesley Ducharme
+@author: V00974267
+"""
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+from typing import Iterator, List, NamedTuple, Optional
+
+
+RESULTS_DIR_NAME: str = os.path.join(".song_cache", "results")
+RESULT_VERSION: int = 1  #changes whenever the csv written for a query changes
+RESULT_SUFFIX: str = ".csv"
+STATS_NAME: str = "stats.json"
+
+
+class CacheStats(NamedTuple):
+    """The hit and miss counts of a result cache, with the entries it holds."""
+    hits: int
+    misses: int
+    entries: int
+    size: int
+
+
+def results_dir_for(files: List[str]) -> str:
+    """Returns the directory the results of queries on the data files are kept in.
+            Parameters
+            ----------
+                files : List[str], required
+                    The data files of the query.
+            Returns
+            -------
+                str
+                    The results directory, next to the first data file.
+    """
+    return os.path.join(os.path.dirname(os.path.abspath(files[0])), RESULTS_DIR_NAME)
+
+
+def query_key(query: tuple, files: List[str]) -> str:
+    """Returns the name of the result of a query on the data files as they are now.
+            Parameters
+            ----------
+                query : tuple, required
+                    The normalized query, every field of which must be json serializable.
+                files : List[str], required
+                    The data files of the query.
+            Returns
+            -------
+                str
+                    A hash of the query and of the path, size and modification time of every data file.
+    """
+    fingerprint: List[list] = []
+    for file in files:
+        stat: os.stat_result = os.stat(file)
+        fingerprint.append([os.path.abspath(file), stat.st_size, stat.st_mtime_ns])
+    return hashlib.sha1(json.dumps([RESULT_VERSION, list(query), fingerprint]).encode("utf-8")).hexdigest()
+
+
+def read_stats(results_dir: str) -> dict:
+    """Reads the hit and miss counts of a results directory, which are 0 if it has none yet."""
+    try:
+        with open(os.path.join(results_dir, STATS_NAME), "r") as file_in:
+            return json.load(file_in)
+    except (OSError, ValueError):
+        return {"hits": 0, "misses": 0}
+
+
+def record(results_dir: str, hit: bool) -> None:
+    """Adds one hit or one miss to the counts of a results directory."""
+    stats: dict = read_stats(results_dir)
+    stats["hits" if hit else "misses"] += 1
+    fd, temp_name = tempfile.mkstemp(dir=results_dir, suffix=".tmp")
+    with os.fdopen(fd, "w") as file_out:
+        json.dump(stats, file_out)
+    os.replace(temp_name, os.path.join(results_dir, STATS_NAME))
+
+
+def lookup(results_dir: str, key: str) -> Optional[str]:
+    """Finds the cached result of a query, marking it as the most recently used and counting the hit or miss.
+            Parameters
+            ----------
+                results_dir : str, required
+                    The results directory of the data files.
+                key : str, required
+                    The name of the result from query_key().
+            Returns
+            -------
+                Optional[str]
+                    The csv file holding the result, or None if it is not cached.
+    """
+    os.makedirs(results_dir, exist_ok=True)
+    path: str = os.path.join(results_dir, key + RESULT_SUFFIX)
+    try:
+        os.utime(path)  #the modification time of a result is when it was last used
+    except FileNotFoundError:
+        record(results_dir, False)
+        return None
+    record(results_dir, True)
+    return path
+
+
+@contextlib.contextmanager
+def new_result(results_dir: str, key: str, max_bytes: int) -> Iterator[str]:
+    """Gives a temporary file to write the result of a query to, which becomes the cached result once the with block
+    ends without an error. A result larger than the whole cache is not kept.
+            Parameters
+            ----------
+                results_dir : str, required
+                    The results directory of the data files.
+                key : str, required
+                    The name of the result from query_key().
+                max_bytes : int, required
+                    The size cap of the cache.
+            Returns
+            -------
+                Iterator[str]
+                    The name of the temporary file.
+    """
+    fd, temp_name = tempfile.mkstemp(dir=results_dir, suffix=".tmp")
+    os.close(fd)
+    try:
+        yield temp_name
+        if os.path.getsize(temp_name) <= max_bytes:
+            os.replace(temp_name, os.path.join(results_dir, key + RESULT_SUFFIX))
+    finally:
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
+
+
+def result_files(results_dir: str) -> List[os.DirEntry]:
+    """Lists the cached results of a results directory, least recently used first."""
+    try:
+        entries: List[os.DirEntry] = [entry for entry in os.scandir(results_dir) if entry.name.endswith(RESULT_SUFFIX)]
+    except OSError:  #no cache yet, or it can not be made next to the data
+        return []
+    return sorted(entries, key=lambda entry: entry.stat().st_mtime_ns)
+
+
+def evict(results_dir: str, max_bytes: int) -> None:
+    """Removes the least recently used results until the results take at most max_bytes.
+            Parameters
+            ----------
+                results_dir : str, required
+                    The results directory of the data files.
+                max_bytes : int, required
+                    The size cap of the cache.
+            Returns
+            -------
+                None
+    """
+    entries: List[os.DirEntry] = result_files(results_dir)
+    size: int = sum(entry.stat().st_size for entry in entries)
+    for entry in entries:
+        if size <= max_bytes:
+            break
+        size -= entry.stat().st_size
+        with contextlib.suppress(FileNotFoundError):  #another run may have removed it first
+            os.remove(entry.path)
+
+
+def cache_stats(results_dir: str) -> CacheStats:
+    """Returns the hit and miss counts and the number and size of the cached results of a results directory."""
+    stats: dict = read_stats(results_dir)
+    entries: List[os.DirEntry] = result_files(results_dir)
+    return CacheStats(stats["hits"], stats["misses"], len(entries), sum(entry.stat().st_size for entry in entries))
+
+
+def stats_report(results_dir: str, max_bytes: int) -> str:
+    """Describes the hit and miss counts and the size of a result cache.
+            Parameters
+            ----------
+                results_dir : str, required
+                    The results directory of the data files.
+                max_bytes : int, required
+                    The size cap of the cache.
+            Returns
+            -------
+                str
+                    The report, one line.
+    """
+    stats: CacheStats = cache_stats(results_dir)
+    queries: int = stats.hits + stats.misses
+    hit_rate: float = 100 * stats.hits / queries if queries > 0 else 0.0
+    return (f'result cache {results_dir}: {stats.hits} hits, {stats.misses} misses ({hit_rate:.1f}% hit rate), '
+            f'{stats.entries} results, {stats.size / 1024:,.1f} KiB of {max_bytes / 1024:,.1f} KiB')
@@ -8,46 +8,170 @@ Sample input: --filter="ARTIST" --value="Dua Lipa" --order_by="STREAMS" --order=
 @author: Wesley Ducharme
 @author: V00974267
 """
+from __future__ import annotations  #annotations name pandas types without importing pandas
+
 import argparse
-import pandas as pd
+import contextlib
+import csv
+import glob
+import gzip
+import heapq
+import io
+import itertools
+import json
+import operator
+import os
+import re
+import shlex
+import shutil
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from typing import Optional
+from typing import IO, TYPE_CHECKING, Dict, Iterator, List, NamedTuple, Optional
 
+import columnar_output
+import stage_profile
 
-def parse_command_line_args() -> argparse.Namespace:
-    """Parse command line arguments.
+if TYPE_CHECKING:  #numpy, pandas and song_cache are imported where they are used, so small queries never load pandas
+    import numpy as np
+    import pandas as pd
+
+
+ORDER_BY_COLUMNS: Dict[str, str] = {"STREAMS": "streams",
+                                    "NO_SPOTIFY_PLAYLISTS": "in_spotify_playlists",
+                                    "NO_APPLE_PLAYLISTS": "in_apple_playlists"}
+DATE_COLUMNS: List[str] = ["released_year", "released_month", "released_day"]
+FILTERS: List[str] = ["ARTIST", "YEAR"]
+OUTPUT_COLUMNS: List[str] = ["released", "track_name", "artist(s)_name"]
+SMALL_INPUT_BYTES: int = 2 * 1024 * 1024  #below this size the csv module is faster than importing pandas
+NA_VALUES: frozenset = frozenset(["", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+                                  "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null"])  #read_csv's missing values
+COMPRESSION_SUFFIXES: Dict[str, str] = {".gz": "gzip", ".zst": "zstd"}
+WRITE_BATCH_ROWS: int = 50000
+WRITE_BUFFER_BYTES: int = 1024 * 1024
+RESULT_CACHE_MIB: int = 64
+BATCH_ARGUMENTS: List[str] = ["data", "filter", "value", "order_by", "order", "limit", "artist", "min_year", "max_year", "min_streams",
+                              "then_by", "output", "output_format", "compression"]  #the arguements run_batch uses per query
+
+
+def make_parser(parser_class: type = argparse.ArgumentParser) -> argparse.ArgumentParser:
+    """Builds the parser of the command line arguments.
             Parameters
             ----------
-                None
+                parser_class : type, optional
+                    The argparse.ArgumentParser class or subclass to build. Default value is argparse.ArgumentParser
+                    which prints errors and exits.
             Returns
             -------
-                argparse.Namespace
-                    The Arguements from the command line and their values.
+                argparse.ArgumentParser
+                    The parser with every arguement of the program.
     """
-    parser = argparse.ArgumentParser(description='Process command line arguments')
-    parser.add_argument('--data', help='csv file to read')
-    parser.add_argument('--filter', help='filter by field')
+    parser = parser_class(description='Process command line arguments')
+    parser.add_argument('--data', help='csv file, directory of csv files or glob of csv files to read')
+    parser.add_argument('--filter', choices=FILTERS, help='filter by field')
     parser.add_argument('--value', help='value for filter')
-    parser.add_argument('--order_by', help='field to order by')
-    parser.add_argument('--order', help='order (ASC or DESC)')
+    parser.add_argument('--order_by', choices=list(ORDER_BY_COLUMNS), help='field to order by')
+    parser.add_argument('--order', choices=['ASC', 'DES', 'DESC'], help='order (ASC or DES)')
     parser.add_argument('--limit', type=int, help='limit number of results')
+    parser.add_argument('--artist', help='only songs whose artist(s)_name contains this, combined with the other filters')
+    parser.add_argument('--min_year', type=int, help='only songs released in or after this year')
+    parser.add_argument('--max_year', type=int, help='only songs released in or before this year')
+    parser.add_argument('--min_streams', type=int, help='only songs with at least this many streams')
+    parser.add_argument('--then_by', action='append', metavar='FIELD[:ASC|DES]',
+                        help=f'break ties of --order_by by another field ({", ".join(ORDER_BY_COLUMNS)}), can be repeated '
+                             '(default order: --order)')
+    parser.add_argument('--output', default='output.csv', help='file to write, - to write to stdout')
+    parser.add_argument('--output_format', '--output-format', choices=columnar_output.FORMATS,
+                        help='format of the output (default: from the .parquet, .arrow or .feather suffix of --output, else csv)')
+    parser.add_argument('--compression', choices=list(COMPRESSION_SUFFIXES.values()),
+                        help='compress the output (default: from the .gz or .zst suffix of --output)')
+    parser.add_argument('--batch', help='file of queries (JSON or one line of arguements per query) to run together')
+    parser.add_argument('--chunksize', type=int, help='stream the csv file in chunks of this many rows')
+    parser.add_argument('--memory', action='store_true', help='report the memory saved by compact dtypes')
+    parser.add_argument('--serve', action='store_true', help='keep the data in memory and answer queries over HTTP on localhost')
+    parser.add_argument('--port', type=int, default=8265, help='port of the query server (default: 8265)')
+    parser.add_argument('--server', help='url of a running query server to send the query to, e.g. http://127.0.0.1:8265')
+    parser.add_argument('--cache_size', type=int, default=RESULT_CACHE_MIB,
+                        help=f'size cap in MiB of the cache of query results, 0 to turn it off (default: {RESULT_CACHE_MIB})')
+    parser.add_argument('--cache_stats', action='store_true', help='report the hits and misses of the result cache')
+    parser.add_argument('--materialize', action='store_true',
+                        help='store the sorted rows of every order_by field so queries without an ARTIST filter need no sort')
+    parser.add_argument('--profile', action='store_true',
+                        help='print the wall time, CPU time and peak memory of every stage of the query to stderr')
+    parser.add_argument('--profile_json', help='also write the --profile report as json to this file, - for stdout')
+    parser.add_argument('--cprofile', help='write cProfile stats of the run to this file (read them with pstats)')
+    return parser
 
-    args: argparse.Namespace = parser.parse_args()
+
+def parse_command_line_args(argv: Optional[List[str]] = None, parser_class: type = argparse.ArgumentParser) -> argparse.Namespace:
+    """Parse command line arguments.
+            Parameters
+            ----------
+                argv : List[str], optional
+                    The arguements to parse. Default value is None which parses the arguements of the program.
+                parser_class : type, optional
+                    The parser class passed to make_parser, its error() handles bad arguements. Default value is
+                    argparse.ArgumentParser which prints the error and exits.
+            Returns
+            -------
+                argparse.Namespace
+                    The Arguements from the command line and their values.
+    """
+    parser: argparse.ArgumentParser = make_parser(parser_class)
+    args: argparse.Namespace = parser.parse_args(argv)
+    if args.batch == None and not (args.serve or args.cache_stats or args.materialize) and args.order_by == None:
+        parser.error('the following arguments are required: --order_by')
+    if args.filter == "ARTIST" and args.artist != None:
+        parser.error('use either --filter=ARTIST or --artist')
+    if args.limit != None and args.limit < 0:
+        parser.error('--limit must be 0 or more')
+    for text in args.then_by or []:
+        try:
+            parse_sort_key(text)
+        except ValueError as error:
+            parser.error(str(error))
+    output_format: str = columnar_output.output_format_for(args.output, args.output_format)
+    if output_format != "csv" and args.server != None:
+        parser.error('--server answers with csv, use --output_format=csv')
+    if output_format in ["arrow", "feather"] and args.compression not in [None] + columnar_output.IPC_COMPRESSIONS:
+        parser.error(f'{output_format} output can only be compressed with {" or ".join(columnar_output.IPC_COMPRESSIONS)}')
     return args
 
 
-def format_date(row: pd.Series) -> str:
+def parse_sort_key(text: str) -> tuple:
+    """Parses a --then_by arguement.
+            Parameters
+            ----------
+                text : str, required
+                    An order_by field, optionally followed by :ASC or :DES.
+            Returns
+            -------
+                tuple
+                    The column of the field and the order, None if the order is not given.
+    """
+    field, _, order = text.partition(":")
+    if field not in ORDER_BY_COLUMNS or order not in ["", "ASC", "DES", "DESC"]:
+        raise ValueError(f'invalid --then_by value {text!r}, use FIELD[:ASC|DES] with FIELD one of {", ".join(ORDER_BY_COLUMNS)}')
+    return ORDER_BY_COLUMNS[field], None if order == "" else order == "ASC"
+
+
+def format_date(year: int, month: int, day: int) -> str:
     """Makes a string structured to tell the date a song was released.
             Parameters
             ----------
-                row: pd.Series
-                    row of data from a pandas dataframe.
+                year: int
+                    The year the song was released.
+                month: int
+                    The month the song was released.
+                day: int
+                    The day the song was released.
             Returns
             -------
                 str
                     The string telling the release date.
     """
-    return datetime(row["released_year"], row["released_month"], row["released_day"]).strftime("%a, %B %d, %Y")
+    return datetime(year, month, day).strftime("%a, %B %d, %Y")
 
 
 def make_release_date_column(df: pd.DataFrame) -> pd.DataFrame:
@@ -61,12 +185,58 @@ def make_release_date_column(df: pd.DataFrame) -> pd.DataFrame:
                 pd.DataFrame
                     The pandas dataframe with the added column.
     """
+    import numpy as np
+
     df = df.copy()
-    df["released"] = df.apply(format_date, axis=1)
+    date_keys: np.ndarray = (df["released_year"].to_numpy(dtype=np.int64) * 10000 + df["released_month"].to_numpy(dtype=np.int64) * 100
+                             + df["released_day"].to_numpy(dtype=np.int64))  #yyyymmdd, one key per row made in bulk
+    unique_keys, codes = np.unique(date_keys, return_inverse=True)
+    date_strings: np.ndarray = np.array([format_date(key // 10000, key // 100 % 100, key % 100) for key in unique_keys.tolist()], dtype=object)
+    df["released"] = date_strings[codes.reshape(-1)]  #each distinct date is only formatted once
     df.insert(0, "released", df.pop("released"))
     return df
 
 
+def sort_rows(df: pd.DataFrame, order_by: str, ascending: bool, limit: Optional[int] = None, then_by: tuple = ()) -> pd.DataFrame:
+    """Sorts the rows of a pandas dataframe, only selecting the first rows when there is a limit.
+            Parameters
+            ----------
+                df : pd.DataFrame, required
+                    The pandas dataframe to sort.
+                order_by : str, required
+                    The column used to sort the rows.
+                ascending : bool, required
+                    True to sort in ascending order, False to sort in descending order.
+                limit : int, optional
+                    The number of rows to keep. Default value is None which keeps every row.
+                then_by : tuple, optional
+                    The (column, ascending) pairs that break ties of the order_by column, in order. Default value is ().
+            Returns
+            -------
+                pd.DataFrame
+                    The sorted rows. Rows with equal values keep the order they had in df.
+    """
+    import pandas as pd
+
+    column: pd.Series = df[order_by]
+    if then_by:
+        if limit != None and 0 < limit < len(df) and pd.api.types.is_numeric_dtype(column.dtype) and not column.hasnans:
+            #only rows whose order_by value beats or ties the limit-th value can be in the result, the rest are not sorted
+            cutoff: object = (column.nsmallest if ascending else column.nlargest)(limit).iloc[-1]
+            df = df[column.to_numpy() <= cutoff] if ascending else df[column.to_numpy() >= cutoff]
+        by: List[str] = [order_by] + [column for column, _ in then_by]
+        sorted_df: pd.DataFrame = df.sort_values(by=by, ascending=[ascending] + [order for _, order in then_by], kind="stable")
+        return sorted_df if limit == None else sorted_df.head(limit)
+
+    if limit == None or not pd.api.types.is_numeric_dtype(column.dtype) or column.hasnans:
+        sorted_df: pd.DataFrame = df.sort_values(by=order_by, ascending=ascending, kind="stable")
+        return sorted_df if limit == None else sorted_df.head(limit)
+
+    if ascending:  #partial selection, keep="first" breaks ties in the same order as the stable sort
+        return df.nsmallest(limit, order_by, keep="first")
+    return df.nlargest(limit, order_by, keep="first")
+
+
 def drop_columns(order_by: str, df: pd.DataFrame) -> pd.DataFrame:
     """Drops unneeded columns from a pandas dataframe based off of which columns are used to order the data.
             Parameters
@@ -78,169 +248,675 @@ def drop_columns(order_by: str, df: pd.DataFrame) -> pd.DataFrame:
             Returns
             -------
                 pd.DataFrame
-                    The pandas dataframe without the dropped columns.
-    """ 
-    if order_by == "in_spotify_playlists":
-    	df_dropped: pd.DataFrame = df.drop(["artist_count", "released_year", "released_month", "released_day", "streams", "in_apple_playlists", \
-                                    "bpm", "key", "mode", "danceability_%"],  axis=1)
-    elif order_by == "in_apple_playlists":
-    	df_dropped: pd.DataFrame = df.drop(["artist_count", "released_year", "released_month", "released_day", "in_spotify_playlists", \
-                                    "streams", "bpm", "key", "mode", "danceability_%"], axis=1)
-    else:
-    	df_dropped: pd.DataFrame = df.drop(["artist_count", "released_year", "released_month", "released_day", "in_spotify_playlists", \
-                                    "in_apple_playlists", "bpm", "key", "mode", "danceability_%"], axis=1)
+                    The pandas dataframe with only the released, track_name, artist(s)_name and order_by columns.
+    """
+    df_dropped: pd.DataFrame = df[OUTPUT_COLUMNS + [order_by]]
     return df_dropped
 
 
-def make_and_work_df(order_by: str, artist: Optional[str] = None, limit: Optional[int] = None, year: Optional[int] = None) -> pd.DataFrame:
-    """Reads the data.csv file and does work on a pandas dataframe it makes by using the specific arguements passed to it.
+class QueryPlan(NamedTuple):
+    """QueryPlan class describing one query over the song data
+        Attributes
+        ----------
+            data: str
+                The csv file, directory of csv files or glob of csv files to read
+            order_by: str
+                The column used to sort the rows
+            ascending: bool
+                True to sort in ascending order, False to sort in descending order
+            artist: Optional[str]
+                The name of the artist to filter the rows by
+            year: Optional[int]
+                The year to filter the rows by
+            limit: Optional[int]
+                The number of songs that will be displayed
+            min_year: Optional[int]
+                The first year of the range of years to filter the rows by
+            max_year: Optional[int]
+                The last year of the range of years to filter the rows by
+            min_streams: Optional[int]
+                The least number of streams of the rows to keep
+            then_by: tuple
+                The (column, ascending) pairs that break ties of the order_by column, in order
+    """
+    data: str
+    order_by: str
+    ascending: bool
+    artist: Optional[str] = None
+    year: Optional[int] = None
+    limit: Optional[int] = None
+    min_year: Optional[int] = None
+    max_year: Optional[int] = None
+    min_streams: Optional[int] = None
+    then_by: tuple = ()
+
+    def read_columns(self) -> List[str]:
+        """Returns the only columns of the csv file the plan needs to read"""
+        columns: List[str] = ["track_name", "artist(s)_name"] + DATE_COLUMNS
+        for column in [self.order_by] + (["streams"] if self.min_streams != None else []) + [column for column, _ in self.then_by]:
+            if column not in columns:
+                columns.append(column)
+        return columns
+
+    def sort_keys(self) -> List[tuple]:
+        """Returns the (column, ascending) pairs the rows are sorted by, the order_by column first"""
+        return [(self.order_by, self.ascending)] + list(self.then_by)
+
+    def has_filter(self) -> bool:
+        """Returns True if the plan drops any rows before sorting"""
+        return any(value != None for value in [self.artist, self.year, self.min_year, self.max_year, self.min_streams])
+
+
+def make_query_plan(args: argparse.Namespace) -> QueryPlan:
+    """Makes a query plan from the command line arguements.
             Parameters
             ----------
-                order_by : str, required
-                    The column used to sort the rows.
-                artist : str, optional
-                    The name of the artist to filter the rows by. Default value is None.
-                limit : int, optional
-                    The number of songs that will be displayed. Defailt value is None.
-                year int, optional
-                    The year by which to filter the rows by. Default value is None.
+                args : argparse.Namespace, required
+                    The arguements to make the plan from.
+            Returns
+            -------
+                QueryPlan
+                    The plan of the query.
+    """
+    artist: Optional[str] = args.artist
+    year: Optional[int] = None
+    if args.filter == "ARTIST":
+        artist = args.value
+    elif args.filter == "YEAR":
+        year = int(args.value)
+    ascending: bool = args.order == "ASC"
+    then_by: tuple = tuple((column, ascending if order == None else order) for column, order in map(parse_sort_key, args.then_by or []))
+
+    return QueryPlan(data=args.data if args.data != None else "data.csv", order_by=ORDER_BY_COLUMNS[args.order_by], ascending=ascending,
+                     artist=artist, year=year, limit=args.limit, min_year=args.min_year, max_year=args.max_year,
+                     min_streams=args.min_streams, then_by=then_by)
+
+
+def data_files(data: str) -> List[str]:
+    """Finds the csv files the --data arguement names.
+            Parameters
+            ----------
+                data : str, required
+                    A csv file, a directory of csv files or a glob of csv files.
+            Returns
+            -------
+                List[str]
+                    The csv files in sorted order.
+    """
+    if os.path.isdir(data):
+        files: List[str] = sorted(glob.glob(os.path.join(data, "*.csv")))
+    elif glob.has_magic(data):
+        files = sorted(glob.glob(data))
+    else:
+        return [data]
+    if not files:
+        raise FileNotFoundError(f'no csv files match {data}')
+    return files
+
+
+def filter_mask(plan: QueryPlan, df: pd.DataFrame) -> np.ndarray:
+    """Evaluates every filter of a query plan on a pandas dataframe into one boolean mask.
+    The numeric filters are combined in place on a single mask array, so no dataframe is made per filter, and the artist
+    filter, the slowest, only tests the rows the numeric filters kept.
+            Parameters
+            ----------
+                plan : QueryPlan, required
+                    The plan holding the filters.
+                df : pd.DataFrame, required
+                    The pandas dataframe to filter.
+            Returns
+            -------
+                np.ndarray
+                    True for every row that passes all the filters.
+    """
+    import numpy as np
+
+    mask: np.ndarray = np.ones(len(df), dtype=bool)
+    if plan.year != None or plan.min_year != None or plan.max_year != None:
+        years: np.ndarray = df["released_year"].to_numpy()
+        if plan.year != None:
+            mask &= years == plan.year
+        if plan.min_year != None:
+            mask &= years >= plan.min_year
+        if plan.max_year != None:
+            mask &= years <= plan.max_year
+    if plan.min_streams != None:
+        mask &= df["streams"].to_numpy() >= plan.min_streams  #missing values compare False, like in pandas
+    if plan.artist != None:
+        rows: np.ndarray = np.flatnonzero(mask)
+        artists: pd.Series = df["artist(s)_name"] if len(rows) == len(df) else df["artist(s)_name"].iloc[rows]
+        mask[rows] = artists.str.contains(plan.artist, na=False).to_numpy(dtype=bool)
+    return mask
+
+
+def filter_rows(plan: QueryPlan, df: pd.DataFrame) -> pd.DataFrame:
+    """Keeps only the rows of a pandas dataframe that pass the filters of a query plan.
+            Parameters
+            ----------
+                plan : QueryPlan, required
+                    The plan holding the filters.
+                df : pd.DataFrame, required
+                    The pandas dataframe to filter.
+            Returns
+            -------
+                pd.DataFrame
+                    The filtered pandas dataframe, made with a single selection of rows.
+    """
+    if not plan.has_filter():
+        return df
+    return df[filter_mask(plan, df)]
+
+
+def read_filtered_rows(plan: QueryPlan) -> pd.DataFrame:
+    """Reads the rows of one csv file that pass the filter of a query plan, only the top limit rows of them if the
+    order_by column has a materialized leaderboard.
+            Parameters
+            ----------
+                plan : QueryPlan, required
+                    The plan of the query to run. Its data must be a single csv file.
+            Returns
+            -------
+                pd.DataFrame
+                    The filtered rows with only the columns the plan uses.
+    """
+    import song_cache
+
+    with stage_profile.stage("load"):  #a cold or outdated cache is built here, so its csv parse is not timed as a lookup
+        try:
+            song_cache.open_cache(plan.data)
+        except OSError:
+            pass  #read_songs reads the csv file itself when the cache can not be written
+    if not plan._replace(year=None).has_filter() and not plan.then_by:
+        #the materialized leaderboard of the order_by column gives the sorted rows, which sort_rows keeps in order
+        with stage_profile.stage("sort"):
+            top_rows: Optional[np.ndarray] = song_cache.find_leaderboard_rows(plan.data, plan.order_by, plan.ascending, plan.year, plan.limit)
+        if top_rows is not None:
+            with stage_profile.stage("load"):
+                return song_cache.read_songs(plan.data, plan.read_columns(), top_rows)
+    if plan.artist != None:
+        with stage_profile.stage("filter"):
+            rows: Optional[np.ndarray] = song_cache.find_artist_rows(plan.data, plan.artist)  #None if the index can not be used
+        if rows is not None:
+            with stage_profile.stage("load"):
+                artist_df: pd.DataFrame = song_cache.read_songs(plan.data, plan.read_columns(), rows)
+            with stage_profile.stage("filter"):  #the index already applied the artist filter
+                return filter_rows(plan._replace(artist=None), artist_df)
+    elif plan.year != None:
+        with stage_profile.stage("load"):
+            year_df: Optional[pd.DataFrame] = song_cache.read_year_partition(plan.data, plan.year, plan.read_columns())
+        if year_df is not None:  #the partition only holds rows of the year, so only the other filters are left
+            with stage_profile.stage("filter"):
+                return filter_rows(plan._replace(year=None), year_df)
+
+    with stage_profile.stage("load"):
+        df: pd.DataFrame = song_cache.read_songs(plan.data, plan.read_columns())  #only the columns the plan uses are loaded
+    with stage_profile.stage("filter"):
+        return filter_rows(plan, df)
+
+
+def read_top_rows(plan: QueryPlan) -> pd.DataFrame:
+    """Reads the rows of one csv file that pass the filter of a query plan and keeps its top limit rows.
+    Runs in the worker processes when several csv files are read.
+            Parameters
+            ----------
+                plan : QueryPlan, required
+                    The plan of the query to run. Its data must be a single csv file.
+            Returns
+            -------
+                pd.DataFrame
+                    The sorted rows, or every filtered row in file order if the plan has no limit.
+    """
+    filtered_df: pd.DataFrame = read_filtered_rows(plan)
+    if plan.limit == None:
+        return filtered_df
+    return sort_rows(filtered_df, plan.order_by, plan.ascending, plan.limit, plan.then_by)
+
+
+def make_and_work_df(plan: QueryPlan) -> pd.DataFrame:
+    """Reads the data files of a query plan and does the work of the plan on a pandas dataframe it makes.
+    Several csv files are read concurrently in a process pool, each worker filtering its file and keeping its top limit
+    rows, and the partial results are merged here.
+            Parameters
+            ----------
+                plan : QueryPlan, required
+                    The plan of the query to run.
             Returns
             -------
                 pd.DataFrame
                     The dataframe worked on.
 
     """
-    file_in = open("data.csv", "r")
+    import pandas as pd
 
-    df: pd.DataFrame = pd.read_csv(file_in)
-    if artist != None:
-    	df = df[df["artist(s)_name"].str.contains(artist)]
-    elif year != None:
-    	df = df[df["released_year"] == year]
+    files: List[str] = data_files(plan.data)
+    if len(files) == 1:
+        return work_filtered_df(plan, read_filtered_rows(plan._replace(data=files[0])))
 
-    if artist == "Dua Lipa":
-    	sorted_df: pd.DataFrame = df.sort_values(by=order_by.lower(), ascending=True)
-    else:
-    	sorted_df: pd.DataFrame = df.sort_values(by=order_by.lower(), ascending=False)
+    with stage_profile.stage("load"), ProcessPoolExecutor(max_workers=min(len(files), os.cpu_count() or 1)) as pool:
+        #the workers also filter and sort their file, which shows up here as load time
+        partial_dfs: List[pd.DataFrame] = list(pool.map(read_top_rows, [plan._replace(data=file) for file in files]))
+    #the partial results are in file order, so the stable sort in work_filtered_df breaks ties by file and then by row
+    return work_filtered_df(plan, pd.concat(partial_dfs, ignore_index=True))
 
-    if limit != None:
-    	sorted_df = sorted_df.head(limit)
 
-    sorted_df_with_date: df.DataFrame = make_release_date_column(sorted_df)  #adds a release date column to the front of the dataframe
-    sorted_droped_df: pd.DataFrame = drop_columns(order_by, sorted_df_with_date)  #drops all unneeded columns from the dataframe
+def work_filtered_df(plan: QueryPlan, filtered_df: pd.DataFrame) -> pd.DataFrame:
+    """Does the work of a query plan that comes after filtering on a pandas dataframe.
+            Parameters
+            ----------
+                plan : QueryPlan, required
+                    The plan of the query to run.
+                filtered_df : pd.DataFrame, required
+                    The rows that passed the filter of the plan. It is not changed.
+            Returns
+            -------
+                pd.DataFrame
+                    The dataframe worked on.
+    """
+    with stage_profile.stage("sort"):
+        sorted_df: pd.DataFrame = sort_rows(filtered_df, plan.order_by, plan.ascending, plan.limit, plan.then_by)
+
+    with stage_profile.stage("date formatting"):
+        sorted_df_with_date: pd.DataFrame = make_release_date_column(sorted_df)  #adds a release date column to the front of the dataframe
+    with stage_profile.stage("column drop"):
+        sorted_droped_df: pd.DataFrame = drop_columns(plan.order_by, sorted_df_with_date)  #drops all unneeded columns from the dataframe
 
-    file_in.close()
     return sorted_droped_df
 
 
-def least_6_streamed_dua_lipa(artist: str, limit: int, order_by: str) -> None:
-    """Finds the 6 most streamed songs by Dua Lipa in 2023 and writes them to an output.csv file in ascending order.
+def work_small_csv(plan: QueryPlan) -> Optional[List[list]]:
+    """Does the work of a query plan with the csv module instead of pandas. It gives the same rows as make_and_work_df and
+    is used for csv files small enough that importing pandas would take longer than the query.
             Parameters
             ----------
-                artist : str, required
-                    The name of the artist to filter the rows by.
-                limit : int, required
-                    The number of songs that will be displayed.
-                order_by : str, required
-                    The column used to sort the rows.
-
+                plan : QueryPlan, required
+                    The plan of the query to run.
             Returns
             -------
-                None.
+                Optional[List[list]]
+                    The rows worked on, or None if a number is missing or not an integer, since pandas would read that
+                    column as floats.
     """
-    file_out = open("output.csv", "w")
-    worked_df: pd.DataFrame = make_and_work_df(order_by, artist, limit)
+    file_in = open(plan.data, "r", encoding="utf-8-sig", newline="")  #utf-8 like read_csv, which also skips a byte order mark
+    reader = csv.reader(file_in)
+    header: List[str] = next(reader)
+    track, artist, year, month, day, value = [header.index(name) for name in ["track_name", "artist(s)_name"] + DATE_COLUMNS + [plan.order_by]]
+    streams: int = header.index("streams")
+    then_values: List[int] = [header.index(column) for column, _ in plan.then_by]
+    year_filter: bool = plan.year != None or plan.min_year != None or plan.max_year != None
 
-    worked_df.to_csv(file_out, index=False)
-    file_out.close()
+    records: List[tuple] = []
+    try:
+        with stage_profile.stage("load"):  #the rows are filtered as they are read, the artist filter last like in filter_mask
+            for row in reader:
+                if year_filter:
+                    released_year: int = int(row[year])
+                    if ((plan.year != None and released_year != plan.year) or (plan.min_year != None and released_year < plan.min_year)
+                            or (plan.max_year != None and released_year > plan.max_year)):
+                        continue
+                if plan.min_streams != None and int(row[streams]) < plan.min_streams:
+                    continue
+                if plan.artist != None and (row[artist] in NA_VALUES or not re.search(plan.artist, row[artist])):
+                    continue  #the same test as str.contains(artist, na=False)
+                records.append((int(row[year]), int(row[month]), int(row[day]), row[track], row[artist], int(row[value]))
+                               + tuple(int(row[column]) for column in then_values))
+    except ValueError:
+        return None
+    finally:
+        file_in.close()
 
+    def sort_key(record: tuple) -> int:
+        """Sorts the records by the order_by value"""
+        return record[5]
 
-def most_streamed_drake(artist: str, order_by: str) -> None:
-    """Finds the most streamed songs by Drake in 2023 and writes them to an output.csv file in descending order.
+    with stage_profile.stage("sort"):
+        if plan.then_by:  #stable sorts by every key, the last key first, leave the records sorted by all the keys
+            for i, (_, ascending) in reversed(list(enumerate(plan.sort_keys(), start=5))):
+                records.sort(key=operator.itemgetter(i), reverse=not ascending)
+            records = records if plan.limit == None else records[:plan.limit]
+        elif plan.limit != None:  #heapq.nsmallest and nlargest are stable like the full sort
+            records = (heapq.nsmallest if plan.ascending else heapq.nlargest)(plan.limit, records, key=sort_key)
+        else:
+            records.sort(key=sort_key, reverse=not plan.ascending)
+    with stage_profile.stage("date formatting"):
+        return [[format_date(year, month, day), "" if track in NA_VALUES else track, "" if artist in NA_VALUES else artist, value]
+                for year, month, day, track, artist, value, *_ in records]
+
+
+@contextlib.contextmanager
+def open_output(file_name: str, compression: Optional[str] = None) -> Iterator[IO]:
+    """Opens the output of a query for writing text through a large write buffer, compressing it if asked to.
             Parameters
             ----------
-                artist : str, required
-                    The name of the artist to filter the rows by.
-                order_by : str, required
-                    The column used to sort the rows.
+                file_name : str, required
+                    The name of the file to write to, or - for stdout.
+                compression : str, optional
+                    gzip or zstd. Default value is None which picks the compression from the suffix of file_name.
+            Returns
+            -------
+                Iterator[IO]
+                    The text stream to write to. It is flushed and closed, leaving stdout open, when the with block ends.
+    """
+    if compression == None:
+        compression = COMPRESSION_SUFFIXES.get(os.path.splitext(file_name)[1])
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError('zstd compression needs the zstandard package (pip install zstandard)') from None
 
+    binary: IO = sys.stdout.buffer if file_name == "-" else open(file_name, "wb", buffering=WRITE_BUFFER_BYTES)
+    layers: List[IO] = [] if file_name == "-" else [binary]
+    if compression == "gzip":
+        binary = gzip.GzipFile(fileobj=binary, mode="wb")
+        layers.insert(0, binary)
+    elif compression == "zstd":
+        binary = zstandard.ZstdCompressor().stream_writer(binary, closefd=False)
+        layers.insert(0, binary)
+
+    text: io.TextIOWrapper = io.TextIOWrapper(binary, encoding="utf-8", newline="")
+    try:
+        yield text
+    finally:
+        text.flush()
+        text.detach()  #the layers are closed in order below, and stdout is never closed
+        for layer in layers:
+            layer.close()
+        if file_name == "-":
+            sys.stdout.buffer.flush()
+
+
+def write_rows(header: List[str], rows: List[list], file_name: str, compression: Optional[str] = None, output_format: str = "csv") -> None:
+    """Writes rows to a csv file the same way pandas would write them.
+            Parameters
+            ----------
+                header : List[str], required
+                    The column names.
+                rows : List[list], required
+                    The rows to write.
+                file_name : str, required
+                    The name of the file to write to, or - for stdout.
+                compression : str, optional
+                    gzip or zstd. Default value is None which picks the compression from the suffix of file_name.
+                output_format : str, optional
+                    One of columnar_output.FORMATS. Default value is csv.
             Returns
             -------
                 None
     """
-    file_out = open("output.csv", "w")
-    worked_df: pd.DataFrame = make_and_work_df(order_by, artist)
-
-    worked_df.to_csv(file_out, index=False)
-    file_out.close()
+    if output_format != "csv":
+        with stage_profile.stage("write"):
+            columnar_output.write_rows(header, rows, file_name, output_format, compression)
+        return
+    with stage_profile.stage("write"), open_output(file_name, compression) as file_out:
+        writer = csv.writer(file_out, lineterminator=os.linesep)
+        writer.writerow(header)
+        writer.writerows(rows)
 
 
-def top_20_streamed(order_by: str, limit: int) -> None:
-    """Finds the 20 most streamed songs in 2023 and writes them to an output.csv file in descending order.
+def stream_top_rows(plan: QueryPlan, chunks: Iterator[pd.DataFrame]) -> pd.DataFrame:
+    """Keeps a running top limit rows of a query plan over chunks of the song data.
             Parameters
             ----------
-                order_by : str, required
-                    The column used to sort the rows.
-                limit : int, required
-                    The number of songs that will be displayed.
+                plan : QueryPlan, required
+                    The plan of the query to run. It must have a limit.
+                chunks : Iterator[pd.DataFrame], required
+                    The chunks of the song data in file order.
+            Returns
+            -------
+                pd.DataFrame
+                    The dataframe worked on.
+    """
+    import pandas as pd
 
+    top_df: Optional[pd.DataFrame] = None
+    for chunk in chunks:
+        with stage_profile.stage("filter"):
+            candidates: pd.DataFrame = filter_rows(plan, chunk)
+        with stage_profile.stage("sort"):
+            if top_df is not None:
+                candidates = pd.concat([top_df, candidates], ignore_index=True)  #top_df is in file order for ties and comes before the chunk
+            top_df = sort_rows(candidates, plan.order_by, plan.ascending, plan.limit, plan.then_by)
+
+    with stage_profile.stage("date formatting"):
+        sorted_df_with_date: pd.DataFrame = make_release_date_column(top_df)
+    with stage_profile.stage("column drop"):
+        return drop_columns(plan.order_by, sorted_df_with_date)
+
+
+def stream_sorted_rows(plan: QueryPlan, chunks: Iterator[pd.DataFrame], file_name: str, compression: Optional[str] = None,
+                       output_format: str = "csv") -> None:
+    """Sorts every row of the song data that passes the filter of a query plan with an external merge sort and writes them
+    to a csv file. Each chunk is sorted and spilled to a temporary csv file, then the sorted runs are merged row by row.
+            Parameters
+            ----------
+                plan : QueryPlan, required
+                    The plan of the query to run.
+                chunks : Iterator[pd.DataFrame], required
+                    The chunks of the song data in file order.
+                file_name : str, required
+                    The name of the file to write to, or - for stdout.
+                compression : str, optional
+                    gzip or zstd. Default value is None which picks the compression from the suffix of file_name.
+                output_format : str, optional
+                    One of columnar_output.FORMATS. Default value is csv.
             Returns
             -------
                 None
     """
-    file_out = open("output.csv", "w")
-    worked_df: pd.DataFrame = make_and_work_df(order_by, None, limit)
+    width: int = len(OUTPUT_COLUMNS) + 1  #the then_by columns are spilled after the output columns and dropped when merged
+    keys: List[tuple] = [(width - 1 + i, ascending) for i, (_, ascending) in enumerate(plan.sort_keys())]
+
+    def sort_key(row: List[str]) -> tuple:
+        """Sorts the rows by their order_by and then_by values, with missing values last like sort_values"""
+        key: List[object] = []
+        for i, ascending in keys:
+            if row[i] == "":
+                key += [1, 0]
+            else:
+                value: object = float(row[i]) if "." in row[i] or "e" in row[i] else int(row[i])
+                key += [0, value if ascending else -value]  #negated, so one ascending merge handles every order
+        return tuple(key)
 
-    worked_df.to_csv(file_out, index=False)
-    file_out.close()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        run_names: List[str] = []
+        float_values: bool = False
+        for chunk in chunks:
+            with stage_profile.stage("filter"):
+                filtered_df: pd.DataFrame = filter_rows(plan, chunk)
+            with stage_profile.stage("sort"):
+                sorted_df: pd.DataFrame = sort_rows(filtered_df, plan.order_by, plan.ascending, then_by=plan.then_by)
+            if len(sorted_df) == 0:
+                continue
+            float_values = float_values or sorted_df[plan.order_by].dtype.kind == "f"
+            run_names.append(os.path.join(tmp_dir, f"run{len(run_names)}.csv"))
+            with stage_profile.stage("date formatting"):
+                sorted_df_with_date: pd.DataFrame = make_release_date_column(sorted_df)
+            with stage_profile.stage("column drop"):
+                run_df: pd.DataFrame = drop_columns(plan.order_by, sorted_df_with_date)
+                if plan.then_by:
+                    run_df = sorted_df_with_date[list(run_df.columns) + [column for column, _ in plan.then_by]]
+            with stage_profile.stage("spill"):
+                run_df.to_csv(run_names[-1], index=False, header=False)
 
+        run_files: List[IO] = [open(run_name, "r", encoding="utf-8", newline="") for run_name in run_names]  #to_csv wrote them as utf-8
+        #heapq.merge takes equal rows from earlier runs first, so ties stay in file order
+        merged_rows: Iterator[List[str]] = heapq.merge(*[csv.reader(run_file) for run_file in run_files], key=sort_key)
+        if plan.then_by:
+            merged_rows = (row[:width] for row in merged_rows)
+        if output_format != "csv":
+            with stage_profile.stage("write"):  #the merge is timed with the write
+                columnar_output.write_rows(OUTPUT_COLUMNS + [plan.order_by], merged_rows, file_name, output_format, compression, float_values)
+        else:
+            with stage_profile.stage("write"), open_output(file_name, compression) as file_out:
+                writer = csv.writer(file_out, lineterminator=os.linesep)
+                writer.writerow(OUTPUT_COLUMNS + [plan.order_by])
+                writer.writerows(merged_rows)
+        for run_file in run_files:
+            run_file.close()
 
-def top_5_spotify_2023(order_by: str, year: int, limit: int) -> None:
-    """Finds the top 5 songs in the most spotify playlists released in 2023 and writes them to an output.csv file in descending order.
+
+def stream_query(plan: QueryPlan, chunksize: int, file_name: str, compression: Optional[str] = None, output_format: str = "csv") -> None:
+    """Runs a query plan over the song data a chunk at a time, so memory use depends on the chunk size and the limit
+    instead of the size of the csv file.
             Parameters
             ----------
-                order_by : str, required
-                    The column used to sort the rows.
-                year : int, required
-                    The year by which to filter the rows.
-                limit : int, required
-                    The number of songs that will be displayed.
+                plan : QueryPlan, required
+                    The plan of the query to run.
+                chunksize : int, required
+                    The number of rows in each chunk.
+                file_name : str, required
+                    The name of the file to write to, or - for stdout.
+                compression : str, optional
+                    gzip or zstd. Default value is None which picks the compression from the suffix of file_name.
+                output_format : str, optional
+                    One of columnar_output.FORMATS. Default value is csv.
+            Returns
+            -------
+                None
+    """
+    import pandas as pd
 
+    chunks: Iterator[pd.DataFrame] = itertools.chain.from_iterable(pd.read_csv(file, usecols=plan.read_columns(), chunksize=chunksize)
+                                                                   for file in data_files(plan.data))
+    chunks = stage_profile.timed_iter("load", chunks)
+    if plan.limit != None:
+        write_csv(stream_top_rows(plan, chunks), file_name, compression, output_format)
+    else:
+        stream_sorted_rows(plan, chunks, file_name, compression, output_format)
+
+
+def write_csv(df: pd.DataFrame, file_name: str, compression: Optional[str] = None, output_format: str = "csv") -> None:
+    """Writes a pandas dataframe to a csv file in batches of rows, so only one batch is ever formatted as text at a time.
+    Any other output format is written by columnar_output.
+            Parameters
+            ----------
+                df : pd.DataFrame, required
+                    The pandas dataframe to write.
+                file_name : str, required
+                    The name of the file to write to, or - for stdout.
+                compression : str, optional
+                    gzip or zstd. Default value is None which picks the compression from the suffix of file_name.
+                output_format : str, optional
+                    One of columnar_output.FORMATS. Default value is csv.
             Returns
             -------
                 None
     """
-    file_out = open("output.csv", "w")
-    worked_df: pd.DataFrame = make_and_work_df(order_by, None, limit, year)
+    if output_format != "csv":
+        with stage_profile.stage("write"):
+            columnar_output.write_df(df, file_name, output_format, compression)
+        return
+    with stage_profile.stage("write"), open_output(file_name, compression) as file_out:
+        for start in range(0, max(len(df), 1), WRITE_BATCH_ROWS):  #an empty dataframe still writes its header
+            df.iloc[start:start + WRITE_BATCH_ROWS].to_csv(file_out, index=False, header=start == 0, lineterminator=os.linesep)
 
-    worked_df.to_csv(file_out, index=False)
-    file_out.close()
 
+def read_data(data: str, columns: List[str]) -> pd.DataFrame:
+    """Reads every row of the data files named by --data.
+            Parameters
+            ----------
+                data : str, required
+                    A csv file, a directory of csv files or a glob of csv files.
+                columns : List[str], required
+                    The columns to read.
+            Returns
+            -------
+                pd.DataFrame
+                    The rows of all the files, in file order.
+    """
+    import pandas as pd
+    import song_cache
+
+    files: List[str] = data_files(data)
+    if len(files) == 1:
+        return song_cache.read_songs(files[0], columns)
+    return pd.concat([song_cache.read_songs(file, columns) for file in files], ignore_index=True)
 
-def top_7_apple_2023(order_by: str, year: int, limit: int) -> None:    
-    """Finds the top 7 songs in the most apple playlists released in 2023 and writes them to an output.csv file in descending order.
+
+def read_batch_file(file_name: str, data: Optional[str] = None) -> List[argparse.Namespace]:
+    """Reads the queries of a batch file.
+    A JSON batch file holds a list of objects whose keys are the arguement names (e.g. {"filter": "YEAR", "value": 2023,
+    "order_by": "STREAMS", "limit": 5, "output": "top5.csv"}). Any other file holds the arguements of one query per line,
+    written the same way as on the command line. Blank lines and lines starting with # are skipped.
+    A query may only use the arguements in BATCH_ARGUMENTS, any other one (e.g. --chunksize) is an error.
             Parameters
             ----------
-                order_by : str, required
-                    The column used to sort the rows.
-                year : int, required
-                    The year by which to filter the rows.
-                limit : int, required
-                    The number of songs that will be displayed.
+                file_name : str, required
+                    The name of the batch file.
+                data : str, optional
+                    The data of the queries that do not name their own, the --data of the command line. Default value is
+                    None which leaves them reading data.csv.
+            Returns
+            -------
+                List[argparse.Namespace]
+                    The arguements of every query. Queries without an output file write to output<n> with the suffix of
+                    their format, e.g. output1.csv or output2.parquet.
+            Raises
+            ------
+                SystemExit
+                    If a query uses an arguement that is not in BATCH_ARGUMENTS.
+    """
+    file_in = open(file_name, "r", encoding="utf-8")
+    text: str = file_in.read()
+    file_in.close()
+
+    if text.lstrip().startswith("["):
+        #true is written as a bare flag and false is left out, like on the command line
+        argvs: List[List[str]] = [[f'--{key}' if item is True else f'--{key}={item}' for key, value in query.items()
+                                   for item in (value if isinstance(value, list) else [value]) if item != None and item is not False]
+                                  for query in json.loads(text)]
+    else:
+        argvs = [shlex.split(line) for line in text.splitlines() if line.strip() and not line.lstrip().startswith("#")]
+
+    defaults: Dict[str, object] = vars(make_parser().parse_args([]))
+    queries: List[argparse.Namespace] = []
+    for number, argv in enumerate(argvs, start=1):
+        if data != None and not any(arg == "--data" or arg.startswith("--data=") for arg in argv):
+            argv = argv + [f'--data={data}']
+        args: argparse.Namespace = parse_command_line_args(argv)
+        unused: List[str] = [f'--{name}' for name, value in vars(args).items() if name not in BATCH_ARGUMENTS and value != defaults[name]]
+        if unused:
+            raise SystemExit(f'song_analyzer.py: error: query {number} of {file_name}: {", ".join(unused)} can not be used in a batch')
+        if not any(arg == "--output" or arg.startswith("--output=") for arg in argv):  #not --output_format
+            args.output = f'output{number}{columnar_output.suffix_for(columnar_output.output_format_for(args.output, args.output_format))}'
+        queries.append(args)
+    return queries
 
+
+def run_batch(file_name: str, data: Optional[str] = None) -> None:
+    """Runs every query of a batch file, reading each data file once and filtering it once per distinct filter.
+            Parameters
+            ----------
+                file_name : str, required
+                    The name of the batch file.
+                data : str, optional
+                    The data of the queries that do not name their own. Default value is None which is data.csv.
             Returns
             -------
                 None
     """
-    file_out = open("output.csv", "w")
-    worked_df: pd.DataFrame = make_and_work_df(order_by, None, limit, year)
+    queries: List[argparse.Namespace] = read_batch_file(file_name, data)
+    plans: List[QueryPlan] = [make_query_plan(args) for args in queries]
 
-    worked_df.to_csv(file_out, index=False)
-    file_out.close()
+    columns: Dict[str, List[str]] = {}
+    for plan in plans:
+        columns.setdefault(plan.data, [])
+        columns[plan.data] += [column for column in plan.read_columns() if column not in columns[plan.data]]
+    with stage_profile.stage("load"):
+        data_dfs: Dict[str, pd.DataFrame] = {data: read_data(data, read_columns) for data, read_columns in columns.items()}
+
+    filtered_dfs: Dict[tuple, pd.DataFrame] = {}  #queries with the same filter share the filtered rows
+    for args, plan in zip(queries, plans):
+        key: tuple = (plan.data, plan.artist, plan.year, plan.min_year, plan.max_year, plan.min_streams)
+        if key not in filtered_dfs:
+            with stage_profile.stage("filter"):
+                filtered_dfs[key] = filter_rows(plan, data_dfs[plan.data])
+        write_csv(work_filtered_df(plan, filtered_dfs[key]), args.output, args.compression,
+                  columnar_output.output_format_for(args.output, args.output_format))
 
 
 def process_data(args: argparse.Namespace) -> None:
-    """Processes the data based on the arguements passed to it from main().
+    """Processes the data based on the arguements passed to it from main() and writes the result to the output file.
             Paramerers
             ----------
                 args : argparse.Namespace, required
@@ -249,24 +925,148 @@ def process_data(args: argparse.Namespace) -> None:
             -------
                 None
     """
-    if args.filter == "ARTIST":
-    	if args.value == "Dua Lipa":
-    	    least_6_streamed_dua_lipa(args.value, args.limit, args.order_by)
-    	else:
-    	    most_streamed_drake(args.value, args.order_by)
-    elif args.filter == None:
-    	top_20_streamed(args.order_by, args.limit)
+    if args.batch != None:
+        run_batch(args.batch, args.data)
+        return
+    if args.serve or args.server != None:
+        import song_server
+        if args.serve:
+            song_server.serve(args.data or "data.csv", args.port)
+        else:
+            song_server.query_server(args)
+        return
+
+    if args.materialize:
+        import song_cache
+        for file in data_files(args.data or "data.csv"):
+            song_cache.materialize_leaderboards(file, list(ORDER_BY_COLUMNS.values()))
+        if args.order_by == None:
+            return
+    if args.cache_stats and args.order_by == None:
+        import result_cache
+        print(result_cache.stats_report(result_cache.results_dir_for(data_files(args.data or "data.csv")),
+                                        args.cache_size * 1024 * 1024), file=sys.stderr)
+        return
+
+    plan: QueryPlan = make_query_plan(args)
+    if args.memory:
+        import song_cache
+        print(song_cache.memory_report(read_data(plan.data, plan.read_columns())), file=sys.stderr)
+    output_format: str = columnar_output.output_format_for(args.output, args.output_format)
+    if args.cache_size > 0 and output_format == "csv":  #the result cache only holds csv
+        run_cached_query(plan, args)
     else:
-    	if args.order_by == "NO_SPOTIFY_PLAYLISTS":
-    	    top_5_spotify_2023("in_spotify_playlists", int(args.value), args.limit)
-    	else:
-    	    top_7_apple_2023("in_apple_playlists", int(args.value), args.limit)
+        run_query(plan, args.chunksize, args.output, args.compression, output_format)
+
+
+def run_query(plan: QueryPlan, chunksize: Optional[int], file_name: str, compression: Optional[str] = None,
+              output_format: str = "csv") -> None:
+    """Runs a query plan and writes its result.
+            Parameters
+            ----------
+                plan : QueryPlan, required
+                    The plan of the query.
+                chunksize : int, optional
+                    Stream the data in chunks of this many rows if it is not None.
+                file_name : str, required
+                    The name of the file to write to, or - for stdout.
+                compression : str, optional
+                    gzip or zstd. Default value is None which picks the compression from the suffix of file_name.
+                output_format : str, optional
+                    One of columnar_output.FORMATS. Default value is csv.
+            Returns
+            -------
+                None
+    """
+    if chunksize != None:
+        stream_query(plan, chunksize, file_name, compression, output_format)
+        return
+    files: List[str] = data_files(plan.data)
+    if len(files) == 1 and os.path.getsize(files[0]) < SMALL_INPUT_BYTES:
+        rows: Optional[List[list]] = work_small_csv(plan._replace(data=files[0]))
+        if rows is not None:
+            write_rows(OUTPUT_COLUMNS + [plan.order_by], rows, file_name, compression, output_format)
+            return
+
+    worked_df: pd.DataFrame = make_and_work_df(plan)
+    write_csv(worked_df, file_name, compression, output_format)
+
+
+def copy_output(source: str, file_name: str, compression: Optional[str] = None) -> None:
+    """Copies a csv file to the output of a query.
+            Parameters
+            ----------
+                source : str, required
+                    The csv file to copy.
+                file_name : str, required
+                    The name of the file to write to, or - for stdout.
+                compression : str, optional
+                    gzip or zstd. Default value is None which picks the compression from the suffix of file_name.
+            Returns
+            -------
+                None
+    """
+    with stage_profile.stage("write"), open(source, "r", encoding="utf-8", newline="") as file_in, open_output(file_name, compression) as file_out:
+        shutil.copyfileobj(file_in, file_out, WRITE_BUFFER_BYTES)
+
+
+def run_cached_query(plan: QueryPlan, args: argparse.Namespace) -> None:
+    """Copies the result of a query from the result cache, running the query and caching its result first if it is not
+    there. A cached result is found without importing pandas. If the cache can not be used, e.g. its directory can not
+    be made next to the data, the query runs without it.
+            Parameters
+            ----------
+                plan : QueryPlan, required
+                    The plan of the query.
+                args : argparse.Namespace, required
+                    The arguements of the query, for the chunksize, output, compression and cache size.
+            Returns
+            -------
+                None
+    """
+    import result_cache
+    files: List[str] = data_files(plan.data)
+    results_dir: str = result_cache.results_dir_for(files)
+    key: str = result_cache.query_key(plan._replace(data=None), files)  #the files are part of the key already
+    max_bytes: int = args.cache_size * 1024 * 1024
+    written: bool = False
+    try:
+        with stage_profile.stage("cache lookup"):
+            cached: Optional[str] = result_cache.lookup(results_dir, key)
+        if cached == None:
+            with result_cache.new_result(results_dir, key, max_bytes) as temp_name:
+                run_query(plan, args.chunksize, temp_name)
+                copy_output(temp_name, args.output, args.compression)
+                written = True
+            result_cache.evict(results_dir, max_bytes)
+        else:
+            copy_output(cached, args.output, args.compression)
+            written = True
+    except OSError:  #as song_cache.read_songs does, a cache that can not be written is not used
+        if not written:
+            run_query(plan, args.chunksize, args.output, args.compression)  #an error of the output itself is raised again here
+    if args.cache_stats:
+        print(result_cache.stats_report(results_dir, max_bytes), file=sys.stderr)
 
 
 def main() -> None:
     """Main entry point of the program."""
-    args: argpars.Namespace = parse_command_line_args()
-    process_data(args)
+    args: argparse.Namespace = parse_command_line_args()
+    if args.profile or args.profile_json != None:
+        stage_profile.enable()
+    if args.cprofile != None:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.runcall(process_data, args)
+        profiler.dump_stats(args.cprofile)
+    else:
+        process_data(args)
+
+    if stage_profile.enabled():
+        profile: dict = stage_profile.report()
+        print(stage_profile.summary_table(profile), file=sys.stderr)
+        if args.profile_json != None:
+            stage_profile.write_json(profile, args.profile_json)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,855 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Columnar on-disk cache for the song data used by song_analyzer.py.
+The csv file is parsed once and every column is stored as a typed .npy file that can be memory mapped
+on later runs. The cache is keyed on the path, size and modification time of the csv file. When the csv file changes
+only the rows appended since the cache was built are parsed, unless the bytes the cache was built from changed, in
+which case the cache is rebuilt.
+@author: Wesley Ducharme
+@author: V00974267
+"""
+import codecs
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+from typing import IO, Dict, List, Optional, Union
+
+
+CACHE_DIR_NAME: str = ".song_cache"
+CACHE_VERSION: int = 4
+CATEGORY_COLUMNS: List[str] = ["artist(s)_name", "key", "mode"]
+MANIFEST_NAME: str = "manifest.json"
+ARTIST_INDEX_NAME: str = "artist_index"
+YEAR_PARTITIONS_NAME: str = "year_partitions"
+LEADERBOARDS_NAME: str = "leaderboards"
+YEAR_COLUMN: str = "released_year"
+ROW_KEY: str = "__row__"
+ARTIST_COLUMN: str = "artist(s)_name"
+NGRAM: int = 3
+REGEX_CHARACTERS: str = r"[.^$*+?{}\[\]\\|()]"
+HASH_BLOCK_BYTES: int = 1024 * 1024
+TEXT_SEPARATOR: str = "\x00"
+
+
+def cache_dir_for(path: str) -> str:
+    """Finds the directory the cache of a csv file is stored in.
+            Parameters
+            ----------
+                path : str, required
+                    The path of the csv file.
+            Returns
+            -------
+                str
+                    The cache directory, which sits next to the csv file.
+    """
+    abs_path: str = os.path.abspath(path)
+    key: str = hashlib.sha1(abs_path.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(os.path.dirname(abs_path), CACHE_DIR_NAME, key)
+
+
+def source_fingerprint(path: str) -> Dict[str, object]:
+    """Makes the fingerprint used to decide if a cache is still valid.
+            Parameters
+            ----------
+                path : str, required
+                    The path of the csv file.
+            Returns
+            -------
+                Dict[str, object]
+                    The absolute path, size and modification time of the csv file and the version of the cache format.
+    """
+    stat: os.stat_result = os.stat(path)
+    return {"source": os.path.abspath(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "version": CACHE_VERSION}
+
+
+def read_manifest(cache_dir: str) -> Optional[dict]:
+    """Reads the manifest of a cache directory.
+            Parameters
+            ----------
+                cache_dir : str, required
+                    The cache directory.
+            Returns
+            -------
+                Optional[dict]
+                    The manifest, or None if there is no readable manifest.
+    """
+    try:
+        with open(os.path.join(cache_dir, MANIFEST_NAME), "r") as file_in:
+            return json.load(file_in)
+    except (OSError, ValueError):
+        return None
+
+
+def compact_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """Downcasts the integer columns of a pandas dataframe to the smallest integer type that holds their values and makes
+    the key, mode and artist(s)_name columns categorical.
+            Parameters
+            ----------
+                df : pd.DataFrame, required
+                    The pandas dataframe as read by read_csv.
+            Returns
+            -------
+                pd.DataFrame
+                    The pandas dataframe with compact dtypes.
+    """
+    df = df.copy()
+    for name in df.columns:
+        if name in CATEGORY_COLUMNS and not isinstance(df[name].dtype, pd.CategoricalDtype):
+            df[name] = df[name].astype("category")
+        elif df[name].dtype.kind in "iu":  #float columns are left alone, their values are written with a decimal point
+            df[name] = pd.to_numeric(df[name], downcast="integer")
+    return df
+
+
+def read_csv_compact(path: Union[str, IO[bytes]], usecols: Optional[List[str]] = None) -> pd.DataFrame:
+    """Reads a csv file of song data with compact dtypes.
+            Parameters
+            ----------
+                path : Union[str, IO[bytes]], required
+                    The path of the csv file, or a binary stream of its contents.
+                usecols : List[str], optional
+                    The columns to read. Default value is None which reads every column.
+            Returns
+            -------
+                pd.DataFrame
+                    The song data.
+    """
+    dtypes: Dict[str, str] = {name: "category" for name in CATEGORY_COLUMNS if usecols is None or name in usecols}
+    return compact_dtypes(pd.read_csv(path, usecols=usecols, dtype=dtypes))
+
+
+def memory_report(df: pd.DataFrame) -> str:
+    """Reports how much memory the compact dtypes of a pandas dataframe save.
+            Parameters
+            ----------
+                df : pd.DataFrame, required
+                    The pandas dataframe with compact dtypes.
+            Returns
+            -------
+                str
+                    The memory used with compact dtypes and with the dtypes read_csv uses by default.
+    """
+    compact: int = int(df.memory_usage(index=False, deep=True).sum())
+    default: int = 0
+    for name in df.columns:
+        column: pd.Series = df[name]
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            default += int(column.astype(object).memory_usage(index=False, deep=True))
+        elif column.dtype.kind in "iu":
+            default += len(column) * 8
+        else:
+            default += int(column.memory_usage(index=False, deep=True))
+    saved: float = 100 * (1 - compact / default) if default else 0.0
+    return f'memory: {compact / 2 ** 20:.2f} MiB with compact dtypes, {default / 2 ** 20:.2f} MiB with default dtypes ({saved:.0f}% saved)'
+
+
+def column_to_array(column: pd.Series) -> np.ndarray:
+    """Converts a column of a pandas dataframe to an array that can be saved and memory mapped.
+            Parameters
+            ----------
+                column : pd.Series, required
+                    The column to convert.
+            Returns
+            -------
+                np.ndarray
+                    The array. Text columns are stored as fixed width unicode arrays.
+    """
+    if is_text(column):
+        return column.fillna("").astype(str).to_numpy(dtype=str)  #read_csv never makes empty strings, so "" marks a missing value
+    return column.to_numpy()
+
+
+def is_text(column: pd.Series) -> bool:
+    """Returns True if a column of a pandas dataframe holds text rather than numbers or booleans."""
+    return not (pd.api.types.is_numeric_dtype(column.dtype) or pd.api.types.is_bool_dtype(column.dtype))
+
+
+def encode_text(column: pd.Series) -> Optional[tuple]:
+    """Encodes a text column as the utf-8 bytes of its values joined by TEXT_SEPARATOR and the offsets of the values in
+    them. Unlike a fixed width unicode array, which takes 4 bytes per character of the longest value for every value,
+    this takes about one byte per character.
+            Parameters
+            ----------
+                column : pd.Series, required
+                    The text column to encode.
+            Returns
+            -------
+                Optional[tuple]
+                    The offsets, where value i is data[offsets[i]:offsets[i + 1] - 1], and the data, or None if a value
+                    contains TEXT_SEPARATOR.
+    """
+    values: List[str] = column.fillna("").astype(str).tolist()  #"" marks a missing value, as in the unicode arrays
+    data: np.ndarray = np.frombuffer(TEXT_SEPARATOR.join(values).encode("utf-8"), dtype=np.uint8)
+    ends: np.ndarray = np.flatnonzero(data == ord(TEXT_SEPARATOR))  #utf-8 never uses a 0 byte inside a character
+    if len(ends) != max(len(values) - 1, 0):
+        return None
+    if not values:
+        return np.zeros(1, dtype=np.int64), data
+    return np.concatenate([[0], ends + 1, [len(data) + 1]]).astype(np.int64), data
+
+
+def decode_text(offsets: np.ndarray, data: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+    """Decodes the values of a text column encoded by encode_text.
+            Parameters
+            ----------
+                offsets : np.ndarray, required
+                    The offsets of the values.
+                data : np.ndarray, required
+                    The utf-8 bytes of the values joined by TEXT_SEPARATOR.
+                rows : np.ndarray, optional
+                    The row numbers to decode. Default value is None which decodes every row.
+            Returns
+            -------
+                np.ndarray
+                    The values as objects, with "" converted back to missing values.
+    """
+    count: int = len(offsets) - 1
+    if rows is None or len(rows) > count // 8:  #splitting all the text at once is faster than decoding many rows one by one
+        values: List[str] = codecs.utf_8_decode(data)[0].split(TEXT_SEPARATOR) if count > 0 else []
+        column: np.ndarray = np.empty(count, dtype=object)
+        column[:] = values
+        if rows is not None:
+            column = column[rows]
+    else:
+        starts: List[int] = offsets[rows].tolist()
+        ends: List[int] = (offsets[np.asarray(rows) + 1] - 1).tolist()
+        column = np.empty(len(starts), dtype=object)
+        column[:] = [codecs.utf_8_decode(data[start:end])[0] for start, end in zip(starts, ends)]
+    column[column == ""] = np.nan
+    return column
+
+
+def save_column(directory: str, i: int, column: pd.Series) -> dict:
+    """Saves one column of a pandas dataframe to a directory as col{i} files that can be memory mapped.
+    Categorical columns are stored as codes with a separate array of categories, text columns as offsets and utf-8
+    bytes, and other columns as they are.
+            Parameters
+            ----------
+                directory : str, required
+                    The directory to write to.
+                i : int, required
+                    The position of the column in the csv file.
+                column : pd.Series, required
+                    The column to save.
+            Returns
+            -------
+                dict
+                    The manifest entry of the column.
+    """
+    file_name: str = f"col{i}.npy"
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        np.save(os.path.join(directory, f"col{i}_categories.npy"), column.cat.categories.astype(str).to_numpy(dtype=str))
+        np.save(os.path.join(directory, file_name), column.cat.codes.to_numpy())
+        return {"file": file_name, "dtype": "category", "categories": f"col{i}_categories.npy"}
+    if is_text(column):
+        encoded: Optional[tuple] = encode_text(column)
+        if encoded is not None:
+            np.save(os.path.join(directory, file_name), encoded[0])
+            np.save(os.path.join(directory, f"col{i}_text.npy"), encoded[1])
+            return {"file": file_name, "dtype": "text", "text": f"col{i}_text.npy"}
+    array: np.ndarray = column_to_array(column)
+    np.save(os.path.join(directory, file_name), array)
+    return {"file": file_name, "dtype": array.dtype.str}
+
+
+def build_cache(path: str, cache_dir: str) -> dict:
+    """Parses a csv file and writes every one of its columns to the cache directory.
+            Parameters
+            ----------
+                path : str, required
+                    The path of the csv file.
+                cache_dir : str, required
+                    The cache directory to write to.
+            Returns
+            -------
+                dict
+                    The manifest of the new cache.
+    """
+    fingerprint: Dict[str, object] = source_fingerprint(path)
+    with open(path, "rb") as file_in:
+        contents: bytes = file_in.read()  #the rows parsed are exactly the bytes hashed, even if the file grows meanwhile
+    df: pd.DataFrame = read_csv_compact(io.BytesIO(contents))
+    fingerprint.update(size=len(contents), sha1=hashlib.sha1(contents).hexdigest())
+    del contents
+
+    parent: str = os.path.dirname(cache_dir)
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir: str = tempfile.mkdtemp(dir=parent)
+    rows: int = len(df)
+    order: List[str] = list(df.columns)
+    columns: Dict[str, dict] = {}
+    for i, name in enumerate(order):
+        columns[name] = save_column(tmp_dir, i, df.pop(name))  #a column is freed as soon as it is saved
+
+    manifest: dict = dict(fingerprint, rows=rows, order=order, columns=columns)
+    replace_cache(cache_dir, tmp_dir, manifest)
+    return manifest
+
+
+def replace_cache(cache_dir: str, tmp_dir: str, manifest: dict) -> None:
+    """Writes the manifest of a cache built in a temporary directory and moves it over the old cache directory.
+            Parameters
+            ----------
+                cache_dir : str, required
+                    The cache directory to replace.
+                tmp_dir : str, required
+                    The temporary directory holding the columns of the new cache.
+                manifest : dict, required
+                    The manifest of the new cache.
+            Returns
+            -------
+                None
+    """
+    write_manifest(tmp_dir, manifest)
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    os.replace(tmp_dir, cache_dir)
+
+
+def write_manifest(cache_dir: str, manifest: dict) -> None:
+    """Writes the manifest of a cache directory, replacing the old one in a single step.
+            Parameters
+            ----------
+                cache_dir : str, required
+                    The cache directory.
+                manifest : dict, required
+                    The manifest to write.
+            Returns
+            -------
+                None
+    """
+    fd, temp_name = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    with os.fdopen(fd, "w") as file_out:
+        json.dump(manifest, file_out)
+    os.replace(temp_name, os.path.join(cache_dir, MANIFEST_NAME))
+
+
+def merge_categories(codes: np.ndarray, categories: np.ndarray, tail: pd.Series) -> tuple:
+    """Appends the values of a categorical column to cached codes, keeping the categories sorted as read_csv would.
+            Parameters
+            ----------
+                codes : np.ndarray, required
+                    The cached codes of the column.
+                categories : np.ndarray, required
+                    The cached categories of the column.
+                tail : pd.Series, required
+                    The categorical values to append.
+            Returns
+            -------
+                tuple
+                    The merged codes and the merged categories.
+    """
+    tail_categories: np.ndarray = tail.cat.categories.astype(str).to_numpy(dtype=str)
+    merged: np.ndarray = np.union1d(categories, tail_categories)
+    new_codes: List[np.ndarray] = []
+    for old_codes, old_categories in ((np.asarray(codes), categories), (tail.cat.codes.to_numpy(), tail_categories)):
+        positions: np.ndarray = np.searchsorted(merged, old_categories)
+        new_codes.append(np.where(old_codes < 0, -1, positions[old_codes] if len(positions) else -1))
+    #from_codes picks the same code width as a full read of the csv file
+    return pd.Categorical.from_codes(np.concatenate(new_codes), categories=merged).codes, merged
+
+
+def append_cache(path: str, cache_dir: str, manifest: dict) -> Optional[dict]:
+    """Brings a cache up to date with a csv file that only had rows appended to it, parsing just the appended bytes.
+    The bytes the cache was built from are hashed again and compared with the sha1 in the manifest first.
+            Parameters
+            ----------
+                path : str, required
+                    The path of the csv file.
+                cache_dir : str, required
+                    The cache directory.
+                manifest : dict, required
+                    The manifest of the cache.
+            Returns
+            -------
+                Optional[dict]
+                    The manifest of the updated cache, or None if the cache has to be rebuilt (the old bytes changed, the
+                    last old row was not ended by a newline, or a column of the new rows has a type that does not merge).
+    """
+    fingerprint: Dict[str, object] = source_fingerprint(path)
+    if any(manifest.get(key) != fingerprint[key] for key in ("source", "version")) or fingerprint["size"] < manifest["size"]:
+        return None
+    digest = hashlib.sha1()
+    with open(path, "rb") as file_in:
+        header: bytes = file_in.readline()
+        file_in.seek(0)
+        remaining: int = manifest["size"]
+        last_byte: bytes = b""
+        while remaining > 0:
+            block: bytes = file_in.read(min(HASH_BLOCK_BYTES, remaining))
+            if not block:
+                return None
+            digest.update(block)
+            remaining -= len(block)
+            last_byte = block[-1:]
+        if digest.hexdigest() != manifest["sha1"] or last_byte != b"\n":
+            return None
+        tail: bytes = file_in.read()
+    digest.update(tail)
+    fingerprint.update(size=manifest["size"] + len(tail), sha1=digest.hexdigest())
+
+    tail_df: pd.DataFrame = read_csv_compact(io.BytesIO(header + tail))
+    if list(tail_df.columns) != manifest["order"]:
+        return None
+    if len(tail_df) == 0:  #only the modification time changed, the columns and the indexes stay as they are
+        updated: dict = dict(manifest, **fingerprint)
+        write_manifest(cache_dir, updated)
+        return updated
+
+    tmp_dir: str = tempfile.mkdtemp(dir=os.path.dirname(cache_dir))
+    columns: Dict[str, dict] = {}
+    for i, name in enumerate(manifest["order"]):
+        cached: np.ndarray = load_column(cache_dir, manifest, name)
+        file_name: str = f"col{i}.npy"
+        if manifest["columns"][name]["dtype"] == "category":
+            merged, categories = merge_categories(cached, load_categories(cache_dir, manifest, name), tail_df[name])
+            np.save(os.path.join(tmp_dir, f"col{i}_categories.npy"), categories)
+            columns[name] = {"file": file_name, "dtype": "category", "categories": f"col{i}_categories.npy"}
+        elif manifest["columns"][name]["dtype"] == "text":
+            encoded: Optional[tuple] = encode_text(tail_df[name]) if is_text(tail_df[name]) else None
+            if encoded is None:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                return None
+            data: np.ndarray = np.load(os.path.join(cache_dir, manifest["columns"][name]["text"]), mmap_mode="r")
+            if manifest["rows"] > 0:  #the appended values start after the separator that follows the last cached value
+                merged = np.concatenate([cached, encoded[0][1:] + cached[-1]])
+                data = np.concatenate([data, np.frombuffer(TEXT_SEPARATOR.encode("utf-8"), dtype=np.uint8), encoded[1]])
+            else:
+                merged, data = encoded
+            np.save(os.path.join(tmp_dir, f"col{i}_text.npy"), data)
+            columns[name] = {"file": file_name, "dtype": "text", "text": f"col{i}_text.npy"}
+        else:
+            appended: np.ndarray = column_to_array(tail_df[name])
+            if not (cached.dtype.kind in "iuf" and appended.dtype.kind in "iuf" or cached.dtype.kind == appended.dtype.kind == "U"):
+                shutil.rmtree(tmp_dir, ignore_errors=True)  #e.g. text in a numeric column, only a full read types it right
+                return None
+            merged = np.concatenate([cached, appended])
+            columns[name] = {"file": file_name, "dtype": merged.dtype.str}
+        np.save(os.path.join(tmp_dir, file_name), merged)
+
+    updated = dict(fingerprint, rows=manifest["rows"] + len(tail_df), order=manifest["order"], columns=columns)
+    replace_cache(cache_dir, tmp_dir, updated)  #the artist index and year partitions are not copied, they are rebuilt
+    return updated
+
+
+def open_cache(path: str) -> tuple:
+    """Finds the cache of a csv file, building it if it is missing and bringing it up to date if the csv file changed.
+            Parameters
+            ----------
+                path : str, required
+                    The path of the csv file.
+            Returns
+            -------
+                tuple
+                    The cache directory and its manifest.
+    """
+    cache_dir: str = cache_dir_for(path)
+    manifest: Optional[dict] = read_manifest(cache_dir)
+    fingerprint: Dict[str, object] = source_fingerprint(path)
+    if manifest is None or any(manifest.get(key) != value for key, value in fingerprint.items()):
+        updated: Optional[dict] = append_cache(path, cache_dir, manifest) if manifest is not None else None
+        if updated is None:
+            updated = build_cache(path, cache_dir)
+        if manifest is not None and LEADERBOARDS_NAME in manifest and LEADERBOARDS_NAME not in updated:
+            #materialized leaderboards stay materialized, they are rebuilt from the new columns when next used
+            updated[LEADERBOARDS_NAME] = manifest[LEADERBOARDS_NAME]
+            write_manifest(cache_dir, updated)
+        manifest = updated
+    return cache_dir, manifest
+
+
+def load_column(cache_dir: str, manifest: dict, name: str) -> np.ndarray:
+    """Memory maps one column of the cache.
+            Parameters
+            ----------
+                cache_dir : str, required
+                    The cache directory.
+                manifest : dict, required
+                    The manifest of the cache.
+                name : str, required
+                    The name of the column.
+            Returns
+            -------
+                np.ndarray
+                    The read only, memory mapped column. Categorical columns are their codes and text columns the
+                    offsets of their values.
+    """
+    return np.load(os.path.join(cache_dir, manifest["columns"][name]["file"]), mmap_mode="r")
+
+
+def load_text(cache_dir: str, manifest: dict, name: str) -> Optional[np.ndarray]:
+    """Memory maps the utf-8 bytes of one text column of the cache, or returns None if the column is not text."""
+    if "text" not in manifest["columns"][name]:
+        return None
+    return np.load(os.path.join(cache_dir, manifest["columns"][name]["text"]), mmap_mode="r")
+
+
+def load_categories(cache_dir: str, manifest: dict, name: str) -> Optional[np.ndarray]:
+    """Loads the categories of one column of the cache.
+            Parameters
+            ----------
+                cache_dir : str, required
+                    The cache directory.
+                manifest : dict, required
+                    The manifest of the cache.
+                name : str, required
+                    The name of the column.
+            Returns
+            -------
+                Optional[np.ndarray]
+                    The categories, or None if the column is not categorical.
+    """
+    if "categories" not in manifest["columns"][name]:
+        return None
+    return np.load(os.path.join(cache_dir, manifest["columns"][name]["categories"]))
+
+
+def array_to_column(array: np.ndarray, categories: Optional[np.ndarray] = None) -> object:
+    """Converts a cached array back to the values pandas would have read from the csv file.
+            Parameters
+            ----------
+                array : np.ndarray, required
+                    The cached array.
+                categories : np.ndarray, optional
+                    The categories if the array holds the codes of a categorical column. Default value is None.
+            Returns
+            -------
+                object
+                    A categorical for categorical columns, otherwise the array with text columns converted to objects and
+                    "" converted back to missing values.
+    """
+    if categories is not None:
+        return pd.Categorical.from_codes(np.asarray(array), categories=categories.astype(object))
+    if array.dtype.kind != "U":
+        return array
+    column: np.ndarray = array.astype(object)
+    column[array == ""] = np.nan
+    return column
+
+
+def read_songs(path: str, usecols: Optional[List[str]] = None, rows: Optional[np.ndarray] = None) -> pd.DataFrame:
+    """Reads a csv file of song data through the columnar cache.
+            Parameters
+            ----------
+                path : str, required
+                    The path of the csv file.
+                usecols : List[str], optional
+                    The columns to read. Default value is None which reads every column.
+                rows : np.ndarray, optional
+                    The row numbers to read, in the order to read them. Default value is None which reads every row.
+            Returns
+            -------
+                pd.DataFrame
+                    The song data, with the columns in the same order as the csv file and indexed by row number.
+    """
+    try:
+        cache_dir, manifest = open_cache(path)
+    except OSError:
+        df: pd.DataFrame = read_csv_compact(path, usecols)  #the cache can not be written next to the csv file
+        return df if rows is None else df.iloc[rows]
+
+    names: List[str] = [name for name in manifest["order"] if usecols is None or name in usecols]
+    data: Dict[str, object] = {}
+    for name in names:
+        array: np.ndarray = load_column(cache_dir, manifest, name)
+        text: Optional[np.ndarray] = load_text(cache_dir, manifest, name)
+        if text is not None:
+            data[name] = decode_text(array, text, rows)
+            continue
+        if rows is not None:
+            array = array[rows]  #only the requested rows are paged in from the memory map
+        data[name] = array_to_column(array, load_categories(cache_dir, manifest, name))
+    return pd.DataFrame(data, columns=names, index=rows)
+
+
+def build_artist_index(cache_dir: str, manifest: dict) -> None:
+    """Builds the inverted index of the artist(s)_name column and stores it in the cache directory.
+    The index maps every distinct artist(s)_name value to its row numbers, and every 3 character substring (trigram)
+    to the distinct values that contain it, so substring searches only have to check a few candidate values.
+            Parameters
+            ----------
+                cache_dir : str, required
+                    The cache directory.
+                manifest : dict, required
+                    The manifest of the cache.
+            Returns
+            -------
+                None
+    """
+    names: np.ndarray = load_column(cache_dir, manifest, ARTIST_COLUMN)
+    categories: Optional[np.ndarray] = load_categories(cache_dir, manifest, ARTIST_COLUMN)
+    if categories is None:
+        unique_names, codes = np.unique(names, return_inverse=True)
+        codes = codes.reshape(-1)
+    else:  #the codes of a categorical column already number its distinct values, missing values become ""
+        unique_names = np.append(categories, "")
+        codes = np.where(names < 0, len(categories), names)
+    name_rows: np.ndarray = np.argsort(codes, kind="stable")  #row numbers grouped by value, in file order inside a group
+    name_offsets: np.ndarray = np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=len(unique_names)))])
+
+    ngram_names: Dict[str, List[int]] = {}
+    for name_id, name in enumerate(unique_names.tolist()):
+        for ngram in {name[i:i + NGRAM] for i in range(len(name) - NGRAM + 1)}:
+            ngram_names.setdefault(ngram, []).append(name_id)
+    ngram_keys: List[str] = sorted(ngram_names)
+    ngram_counts: List[int] = [len(ngram_names[ngram]) for ngram in ngram_keys]
+
+    arrays: Dict[str, np.ndarray] = {
+        "names": unique_names,
+        "name_rows": name_rows.astype(np.int64),
+        "name_offsets": name_offsets.astype(np.int64),
+        "ngram_keys": np.array(ngram_keys, dtype=f"<U{NGRAM}"),
+        "ngram_names": np.array([name_id for ngram in ngram_keys for name_id in ngram_names[ngram]], dtype=np.int64),
+        "ngram_offsets": np.concatenate([[0], np.cumsum(ngram_counts, dtype=np.int64)]),
+    }
+    tmp_dir: str = tempfile.mkdtemp(dir=cache_dir)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_dir, f"{name}.npy"), array)
+    index_dir: str = os.path.join(cache_dir, ARTIST_INDEX_NAME)
+    shutil.rmtree(index_dir, ignore_errors=True)
+    os.replace(tmp_dir, index_dir)
+
+
+def find_artist_rows(path: str, artist: str) -> Optional[np.ndarray]:
+    """Finds the rows whose artist(s)_name contains a string with the inverted index, building the index the first time.
+    The result is the same as the rows where df["artist(s)_name"].str.contains(artist) is True.
+            Parameters
+            ----------
+                path : str, required
+                    The path of the csv file.
+                artist : str, required
+                    The string to search for.
+            Returns
+            -------
+                Optional[np.ndarray]
+                    The sorted row numbers, or None if the index can not answer the search (the string is shorter than a
+                    trigram, is a regular expression, or the cache can not be written).
+    """
+    if len(artist) < NGRAM or re.search(REGEX_CHARACTERS, artist):
+        return None
+    try:
+        cache_dir, manifest = open_cache(path)
+        index_dir: str = os.path.join(cache_dir, ARTIST_INDEX_NAME)
+        if not os.path.isdir(index_dir):
+            build_artist_index(cache_dir, manifest)
+        index: Dict[str, np.ndarray] = {name[:-4]: np.load(os.path.join(index_dir, name), mmap_mode="r")
+                                        for name in os.listdir(index_dir)}
+    except OSError:
+        return None
+
+    candidates: Optional[np.ndarray] = None
+    for ngram in {artist[i:i + NGRAM] for i in range(len(artist) - NGRAM + 1)}:
+        position: int = int(np.searchsorted(index["ngram_keys"], ngram))
+        if position == len(index["ngram_keys"]) or index["ngram_keys"][position] != ngram:
+            return np.empty(0, dtype=np.int64)
+        name_ids: np.ndarray = index["ngram_names"][index["ngram_offsets"][position]:index["ngram_offsets"][position + 1]]
+        candidates = name_ids if candidates is None else np.intersect1d(candidates, name_ids, assume_unique=True)
+
+    offsets: np.ndarray = index["name_offsets"]
+    row_groups: List[np.ndarray] = [index["name_rows"][offsets[name_id]:offsets[name_id + 1]]
+                                    for name_id in candidates.tolist() if artist in index["names"][name_id]]
+    if not row_groups:
+        return np.empty(0, dtype=np.int64)
+    return np.sort(np.concatenate(row_groups))
+
+
+def build_year_partitions(cache_dir: str, manifest: dict) -> None:
+    """Writes the song data partitioned by released_year to the cache directory.
+    Every year gets one uncompressed .npz file holding all the columns and the original row numbers of its rows,
+    and partitions.json lists the file and row count of every year.
+            Parameters
+            ----------
+                cache_dir : str, required
+                    The cache directory.
+                manifest : dict, required
+                    The manifest of the cache.
+            Returns
+            -------
+                None
+    """
+    years: np.ndarray = np.asarray(load_column(cache_dir, manifest, YEAR_COLUMN))
+    year_rows: np.ndarray = np.argsort(years, kind="stable")  #row numbers grouped by year, in file order inside a year
+    unique_years, counts = np.unique(years, return_counts=True)
+    columns: Dict[str, np.ndarray] = {name: load_column(cache_dir, manifest, name) for name in manifest["order"]}
+    for name in manifest["order"]:
+        text: Optional[np.ndarray] = load_text(cache_dir, manifest, name)
+        if text is not None:  #decoded once, every partition encodes its own values again
+            columns[name] = decode_text(columns[name], text)
+
+    tmp_dir: str = tempfile.mkdtemp(dir=cache_dir)
+    partitions: Dict[str, dict] = {}
+    start: int = 0
+    for year, count in zip(unique_years.tolist(), counts.tolist()):
+        rows: np.ndarray = year_rows[start:start + count]
+        start += count
+        file_name: str = f"year={year}.npz"
+        arrays: Dict[str, np.ndarray] = {}
+        for i, name in enumerate(manifest["order"]):
+            if manifest["columns"][name]["dtype"] == "text":
+                arrays[f"col{i}"], arrays[f"col{i}_text"] = encode_text(pd.Series(columns[name][rows], dtype=object))
+            else:
+                arrays[f"col{i}"] = columns[name][rows]
+        np.savez(os.path.join(tmp_dir, file_name), **arrays, **{ROW_KEY: rows.astype(np.int64)})
+        partitions[str(year)] = {"file": file_name, "rows": count}
+
+    with open(os.path.join(tmp_dir, "partitions.json"), "w") as file_out:
+        json.dump({"column": YEAR_COLUMN, "partitions": partitions}, file_out)
+    partitions_dir: str = os.path.join(cache_dir, YEAR_PARTITIONS_NAME)
+    shutil.rmtree(partitions_dir, ignore_errors=True)
+    os.replace(tmp_dir, partitions_dir)
+
+
+def read_year_partition(path: str, year: int, usecols: Optional[List[str]] = None) -> Optional[pd.DataFrame]:
+    """Reads only the rows of one released_year from the year partitions, writing the partitions the first time.
+            Parameters
+            ----------
+                path : str, required
+                    The path of the csv file.
+                year : int, required
+                    The released_year of the rows to read.
+                usecols : List[str], optional
+                    The columns to read. Default value is None which reads every column.
+            Returns
+            -------
+                Optional[pd.DataFrame]
+                    The rows of the year indexed by row number, or None if the partitions can not be used.
+    """
+    try:
+        cache_dir, manifest = open_cache(path)
+        if manifest["columns"][YEAR_COLUMN]["dtype"][1] not in "iu":
+            return None  #years with missing values are floats and are not partitioned
+        partitions_dir: str = os.path.join(cache_dir, YEAR_PARTITIONS_NAME)
+        if not os.path.isdir(partitions_dir):
+            build_year_partitions(cache_dir, manifest)
+        with open(os.path.join(partitions_dir, "partitions.json"), "r") as file_in:
+            partitions: Dict[str, dict] = json.load(file_in)["partitions"]
+    except OSError:
+        return None
+
+    if str(year) not in partitions:
+        return read_songs(path, usecols, np.empty(0, dtype=np.int64))
+
+    names: List[str] = [name for name in manifest["order"] if usecols is None or name in usecols]
+    data: Dict[str, object] = {}
+    with np.load(os.path.join(partitions_dir, partitions[str(year)]["file"])) as partition:
+        for name in names:  #only the members of the requested columns are read from the file
+            key: str = f"col{manifest['order'].index(name)}"
+            if manifest["columns"][name]["dtype"] == "text":
+                data[name] = decode_text(partition[key], partition[f"{key}_text"])
+            else:
+                data[name] = array_to_column(partition[key], load_categories(cache_dir, manifest, name))
+        rows: np.ndarray = partition[ROW_KEY]
+    return pd.DataFrame(data, columns=names, index=rows)
+
+
+def build_leaderboards(cache_dir: str, manifest: dict) -> None:
+    """Writes the leaderboards of the columns listed in the manifest to the cache directory.
+    The leaderboard of a column is the permutation of row numbers that sorts the column, in ascending and in descending
+    order, with ties in file order, over the whole file and inside every released_year. Only integer columns, which
+    have no missing values, get a leaderboard.
+            Parameters
+            ----------
+                cache_dir : str, required
+                    The cache directory.
+                manifest : dict, required
+                    The manifest of the cache, listing the columns to rank under "leaderboards".
+            Returns
+            -------
+                None
+    """
+    row_type: type = np.int32 if manifest["rows"] < 2 ** 31 else np.int64
+    arrays: Dict[str, np.ndarray] = {}
+    years: Optional[np.ndarray] = None
+    if manifest["columns"][YEAR_COLUMN]["dtype"][1] in "iu":
+        years = np.asarray(load_column(cache_dir, manifest, YEAR_COLUMN)).astype(np.int64)
+        unique_years, counts = np.unique(years, return_counts=True)
+        arrays["years"] = unique_years
+        arrays["year_offsets"] = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    for name in manifest[LEADERBOARDS_NAME]:
+        if name not in manifest["columns"] or manifest["columns"][name]["dtype"][1] not in "iu":
+            continue
+        i: int = manifest["order"].index(name)
+        values: np.ndarray = np.asarray(load_column(cache_dir, manifest, name)).astype(np.int64)
+        #argsort and lexsort are stable, and negating the values sorts in descending order keeping ties in file order
+        arrays[f"col{i}_asc"] = np.argsort(values, kind="stable").astype(row_type)
+        arrays[f"col{i}_desc"] = np.argsort(-values, kind="stable").astype(row_type)
+        if years is not None:
+            arrays[f"col{i}_year_asc"] = np.lexsort((values, years)).astype(row_type)
+            arrays[f"col{i}_year_desc"] = np.lexsort((-values, years)).astype(row_type)
+
+    tmp_dir: str = tempfile.mkdtemp(dir=cache_dir)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_dir, f"{name}.npy"), array)
+    leaderboards_dir: str = os.path.join(cache_dir, LEADERBOARDS_NAME)
+    shutil.rmtree(leaderboards_dir, ignore_errors=True)
+    os.replace(tmp_dir, leaderboards_dir)
+
+
+def materialize_leaderboards(path: str, columns: List[str]) -> None:
+    """Builds the leaderboards of some columns of a csv file and keeps them up to date from then on.
+            Parameters
+            ----------
+                path : str, required
+                    The path of the csv file.
+                columns : List[str], required
+                    The columns to rank.
+            Returns
+            -------
+                None
+    """
+    cache_dir, manifest = open_cache(path)
+    manifest[LEADERBOARDS_NAME] = list(columns)
+    write_manifest(cache_dir, manifest)
+    build_leaderboards(cache_dir, manifest)
+
+
+def find_leaderboard_rows(path: str, column: str, ascending: bool, year: Optional[int] = None,
+                          limit: Optional[int] = None) -> Optional[np.ndarray]:
+    """Finds the rows of a csv file sorted by a column by slicing its leaderboard, rebuilding the leaderboards if the
+    csv file changed since they were materialized.
+    The result is the same as the row numbers of a stable sort of the rows (of the year) by the column.
+            Parameters
+            ----------
+                path : str, required
+                    The path of the csv file.
+                column : str, required
+                    The column to sort by.
+                ascending : bool, required
+                    True for ascending order, False for descending order.
+                year : int, optional
+                    Only the rows of this released_year. Default value is None which ranks every row.
+                limit : int, optional
+                    The number of rows to return. Default value is None which returns every row.
+            Returns
+            -------
+                Optional[np.ndarray]
+                    The sorted row numbers, or None if the column has no leaderboard.
+    """
+    try:
+        cache_dir, manifest = open_cache(path)
+        if column not in manifest.get(LEADERBOARDS_NAME, []):
+            return None  #leaderboards are only kept for the columns that were materialized
+        leaderboards_dir: str = os.path.join(cache_dir, LEADERBOARDS_NAME)
+        if not os.path.isdir(leaderboards_dir):
+            build_leaderboards(cache_dir, manifest)
+        name: str = f"col{manifest['order'].index(column)}_{'year_' if year is not None else ''}{'asc' if ascending else 'desc'}"
+        ranking: np.ndarray = np.load(os.path.join(leaderboards_dir, f"{name}.npy"), mmap_mode="r")
+        if year is not None:
+            years: np.ndarray = np.load(os.path.join(leaderboards_dir, "years.npy"))
+            offsets: np.ndarray = np.load(os.path.join(leaderboards_dir, "year_offsets.npy"))
+    except (OSError, ValueError):  #no leaderboard file for a column with missing values or for float years
+        return None
+
+    if year is not None:
+        position: int = int(np.searchsorted(years, year))
+        if position == len(years) or years[position] != year:
+            return np.empty(0, dtype=np.int64)
+        ranking = ranking[offsets[position]:offsets[position + 1]]
+    return np.asarray(ranking[:limit], dtype=np.int64)  #only the slice is paged in from the memory map
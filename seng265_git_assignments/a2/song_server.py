@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Query server for song_analyzer.py.
+The song data is loaded once and kept in memory, and queries using the song_analyzer.py arguements are answered over
+HTTP on localhost, e.g. GET /query?filter=ARTIST&value=Drake&order_by=STREAMS&order=DES&limit=5 returns the csv output.
+Start it with: ./song_analyzer.py --data="data.csv" --serve --port="8265"
+Query it with: ./song_analyzer.py --server="http://127.0.0.1:8265" --filter="YEAR" --value="2023" --order_by="STREAMS"
+@author: Wesley Ducharme
+@author: V00974267
+"""
+from __future__ import annotations
+
+import argparse
+import io
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import TYPE_CHECKING, List, Optional
+
+import song_analyzer
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+HOST: str = "127.0.0.1"
+QUERY_ARGUMENTS: List[str] = ["filter", "value", "order_by", "order", "limit", "artist", "min_year", "max_year", "min_streams", "then_by"]
+RELOAD_INTERVAL: float = 1.0
+
+
+class SongData:
+    """SongData class holding the song data in memory and reloading it when the data files change
+        Attributes
+        ----------
+            data: str
+                The csv file, directory of csv files or glob of csv files the data is read from
+            df: pd.DataFrame
+                The song data, with every column a query can use
+            fingerprint: List[tuple]
+                The name, size and modification time of every data file when the data was read
+    """
+    COLUMNS: List[str] = ["track_name", "artist(s)_name"] + song_analyzer.DATE_COLUMNS + list(song_analyzer.ORDER_BY_COLUMNS.values())
+
+    def __init__(self, data: str) -> None:
+        """Constructor for SongData class
+            Parameters
+            ----------
+                data: str
+                    The csv file, directory of csv files or glob of csv files to read
+            Returns
+            -------
+                None
+        """
+        self.data: str = data
+        self.__lock: threading.Lock = threading.Lock()
+        self.fingerprint: List[tuple] = self.read_fingerprint()
+        self.df: pd.DataFrame = song_analyzer.read_data(data, SongData.COLUMNS)
+
+    def read_fingerprint(self) -> List[tuple]:
+        """Reads the name, size and modification time of every data file
+            Parameters
+            ----------
+                None
+            Returns
+            -------
+                List[tuple]
+                    The fingerprint of the data files
+        """
+        fingerprint: List[tuple] = []
+        for file in song_analyzer.data_files(self.data):
+            stat: os.stat_result = os.stat(file)
+            fingerprint.append((file, stat.st_size, stat.st_mtime_ns))
+        return fingerprint
+
+    def reload_if_changed(self) -> bool:
+        """Reads the data again if a data file was added, removed or changed
+            Parameters
+            ----------
+                None
+            Returns
+            -------
+                bool
+                    True if the data was reloaded
+        """
+        fingerprint: List[tuple] = self.read_fingerprint()
+        if fingerprint == self.fingerprint:
+            return False
+        df: pd.DataFrame = song_analyzer.read_data(self.data, SongData.COLUMNS)
+        with self.__lock:  #queries already running keep the dataframe they started with
+            self.df = df
+            self.fingerprint = fingerprint
+        return True
+
+    def watch(self, interval: float = RELOAD_INTERVAL) -> None:
+        """Checks the data files for changes forever, reloading the data when they change
+            Parameters
+            ----------
+                interval: float
+                    The number of seconds between checks
+            Returns
+            -------
+                None
+        """
+        while True:
+            time.sleep(interval)
+            try:
+                if self.reload_if_changed():
+                    log(f'reloaded {self.data} ({len(self.df)} rows)')
+            except Exception as error:  #a file caught half written is read again on the next check, the old data is kept
+                log(f'reload of {self.data} failed: {type(error).__name__}: {error}')
+
+    def query(self, plan: song_analyzer.QueryPlan) -> pd.DataFrame:
+        """Runs a query plan on the song data in memory
+            Parameters
+            ----------
+                plan: song_analyzer.QueryPlan
+                    The plan of the query to run
+            Returns
+            -------
+                pd.DataFrame
+                    The dataframe worked on
+        """
+        with self.__lock:
+            df: pd.DataFrame = self.df
+        return song_analyzer.work_filtered_df(plan, song_analyzer.filter_rows(plan, df))
+
+
+class QueryArgumentParser(argparse.ArgumentParser):
+    """QueryArgumentParser class raising bad arguements of a query as ValueError instead of printing them and exiting,
+    so the server answers them without touching the stderr other queries log to
+    """
+
+    def error(self, message: str) -> None:
+        """Raises the error of a bad arguement
+            Parameters
+            ----------
+                message: str
+                    The error argparse reports
+            Returns
+            -------
+                None
+        """
+        raise ValueError(message)
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """QueryHandler class answering GET /query requests with the csv output of the query
+        Attributes
+        ----------
+            songs: SongData
+                The song data the queries run on
+    """
+    songs: Optional[SongData] = None
+
+    def do_GET(self) -> None:
+        """Answers one query and logs its latency. Bad arguements and patterns are answered with 400, any other error
+        with 500, so the client always gets a response.
+            Parameters
+            ----------
+                None
+            Returns
+            -------
+                None
+        """
+        start: float = time.perf_counter()
+        url: urllib.parse.SplitResult = urllib.parse.urlsplit(self.path)
+        status: int = 200
+        rows: int = 0
+        try:
+            if url.path != "/query":
+                status, body = 404, "unknown path, use /query\n"
+            else:
+                argv: List[str] = [f'--{key}={value}' for key, value in urllib.parse.parse_qsl(url.query) if key in QUERY_ARGUMENTS]
+                plan: song_analyzer.QueryPlan = song_analyzer.make_query_plan(parse_query_args(argv))
+                worked_df: pd.DataFrame = QueryHandler.songs.query(plan)
+                rows = len(worked_df)
+                body = worked_df.to_csv(index=False, lineterminator=os.linesep)
+        except (ValueError, re.error) as error:  #re.error is an invalid --value pattern
+            status, body = 400, f'{error}\n'
+        except Exception as error:
+            status, body = 500, f'query failed: {type(error).__name__}: {error}\n'
+
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "text/csv; charset=utf-8" if status == 200 else "text/plain; charset=utf-8")
+            encoded: bytes = body.encode("utf-8")
+            self.send_header("Content-Length", str(len(encoded)))
+            self.end_headers()
+            self.wfile.write(encoded)
+        finally:
+            error_text: str = "" if status == 200 else f' {body.strip()}'
+            log(f'{self.path} {status} {rows} rows {(time.perf_counter() - start) * 1000:.1f} ms{error_text}')
+
+    def log_message(self, format: str, *args) -> None:
+        """Silences the default request log, do_GET logs every query with its latency instead"""
+
+
+def log(message: str) -> None:
+    """Prints a timestamped message to stderr"""
+    print(f'[{time.strftime("%Y-%m-%d %H:%M:%S")}] {message}', file=sys.stderr, flush=True)
+
+
+def parse_query_args(argv: List[str]) -> argparse.Namespace:
+    """Parses the arguements of a query sent to the server with the same rules as the command line.
+            Parameters
+            ----------
+                argv : List[str], required
+                    The arguements of the query.
+            Returns
+            -------
+                argparse.Namespace
+                    The arguements and their values.
+    """
+    return song_analyzer.parse_command_line_args(argv, QueryArgumentParser)
+
+
+def serve(data: str, port: int) -> None:
+    """Loads the song data and answers queries on localhost until interrupted.
+            Parameters
+            ----------
+                data : str, required
+                    The csv file, directory of csv files or glob of csv files to read.
+                port : int, required
+                    The port to listen on.
+            Returns
+            -------
+                None
+    """
+    start: float = time.perf_counter()
+    QueryHandler.songs = SongData(data)
+    log(f'loaded {data} ({len(QueryHandler.songs.df)} rows) in {time.perf_counter() - start:.2f} s')
+    threading.Thread(target=QueryHandler.songs.watch, daemon=True).start()
+
+    server: ThreadingHTTPServer = ThreadingHTTPServer((HOST, port), QueryHandler)
+    log(f'serving on http://{HOST}:{server.server_address[1]}/query')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def query_server(args: argparse.Namespace) -> None:
+    """Sends a query to a running server and writes its csv output like a local query would.
+            Parameters
+            ----------
+                args : argparse.Namespace, required
+                    The arguements of the query, with the url of the server in args.server.
+            Returns
+            -------
+                None
+    """
+    params: List[tuple] = [(key, value) for key in QUERY_ARGUMENTS if getattr(args, key) != None
+                           for value in (getattr(args, key) if isinstance(getattr(args, key), list) else [getattr(args, key)])]
+    url: str = f'{args.server.rstrip("/")}/query?{urllib.parse.urlencode(params)}'
+    try:
+        response = urllib.request.urlopen(url)
+    except urllib.error.HTTPError as error:
+        raise SystemExit(f'song_analyzer.py: error: {error.read().decode("utf-8").strip()}') from None
+
+    with response, song_analyzer.open_output(args.output, args.compression) as file_out:
+        shutil.copyfileobj(io.TextIOWrapper(response, encoding="utf-8", newline=""), file_out)
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Stage timing for song_analyzer.py --profile.
+Every stage of a query (load, filter, sort, date formatting, column drop, write) runs inside stage(), which records its
+wall time, CPU time and the peak resident memory of the process when it ends, with how much the stage raised it.
+The peak is read with getrusage instead of tracing allocations, which would slow the stages down several times.
+Nothing is recorded until enable() is called, so the stages cost nothing on normal runs.
+@author: Wesley Ducharme
+@author: V00974267
+"""
+import contextlib
+import json
+import sys
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, TypeVar
+
+try:
+    import resource  #not available on Windows, where the peak RSS is not reported
+except ImportError:
+    resource = None
+
+
+STAGES: List[str] = ["load", "filter", "sort", "date formatting", "column drop", "write"]
+T = TypeVar("T")
+
+
+class StageStats:
+    """StageStats class adding up the runs of one stage
+        Attributes
+        ----------
+            calls: int
+                The number of times the stage ran
+            wall: float
+                The wall time of the stage in seconds
+            cpu: float
+                The CPU time of the process during the stage in seconds
+            peak_rss: int
+                The peak resident memory of the process in bytes after the last run of the stage
+            rss_growth: int
+                How many bytes the runs of the stage raised the peak resident memory of the process by
+    """
+
+    def __init__(self) -> None:
+        """Constructor for StageStats class"""
+        self.calls: int = 0
+        self.wall: float = 0.0
+        self.cpu: float = 0.0
+        self.peak_rss: int = 0
+        self.rss_growth: int = 0
+
+
+_stages: Optional[Dict[str, StageStats]] = None
+_start: float = 0.0
+_start_cpu: float = 0.0
+
+
+def enable() -> None:
+    """Starts recording the stages, and the total wall and CPU time of the run from now on."""
+    global _stages, _start, _start_cpu
+    _stages = {}
+    _start = time.perf_counter()
+    _start_cpu = time.process_time()
+
+
+def enabled() -> bool:
+    """Returns True if the stages are being recorded."""
+    return _stages is not None
+
+
+@contextlib.contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Records the time and memory taken by the code in the with block as a run of a stage.
+            Parameters
+            ----------
+                name : str, required
+                    The name of the stage, one of STAGES or any other name.
+            Returns
+            -------
+                Iterator[None]
+    """
+    if _stages is None:
+        yield
+        return
+
+    rss: int = max_rss() or 0
+    wall: float = time.perf_counter()
+    cpu: float = time.process_time()
+    try:
+        yield
+    finally:
+        stats: StageStats = _stages.setdefault(name, StageStats())
+        stats.calls += 1
+        stats.wall += time.perf_counter() - wall
+        stats.cpu += time.process_time() - cpu
+        stats.peak_rss = max_rss() or 0
+        stats.rss_growth += stats.peak_rss - rss
+
+
+def timed_iter(name: str, iterable: Iterable[T]) -> Iterator[T]:
+    """Records the time taken to get every item of an iterable as a run of a stage, e.g. reading chunks of a csv file.
+            Parameters
+            ----------
+                name : str, required
+                    The name of the stage.
+                iterable : Iterable[T], required
+                    The iterable to time.
+            Returns
+            -------
+                Iterator[T]
+                    The items of the iterable.
+    """
+    iterator: Iterator[T] = iter(iterable)
+    while True:
+        with stage(name):
+            try:
+                item: T = next(iterator)
+            except StopIteration:
+                return
+        yield item  #the work done on the item by the caller is not part of the stage
+
+
+def max_rss() -> Optional[int]:
+    """Returns the peak resident memory of the process in bytes, or None where it can not be read."""
+    try:
+        with open("/proc/self/status", "r") as file_in:  #Linux, where getrusage would also count the parent before exec
+            for line in file_in:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    rss: int = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024  #bytes on macOS, kilobytes on Linux
+
+
+def report() -> dict:
+    """Returns the recorded stages, the stages of STAGES first and in pipeline order, as a json serializable dict.
+            Parameters
+            ----------
+                None
+            Returns
+            -------
+                dict
+                    The stages with their calls, wall and CPU seconds and peak resident memory, the total wall and CPU
+                    seconds of the run since enable() and the peak resident memory of the process.
+    """
+    names: List[str] = [name for name in STAGES if name in _stages] + [name for name in _stages if name not in STAGES]
+    return {"stages": [{"stage": name, "calls": _stages[name].calls, "wall_seconds": _stages[name].wall,
+                        "cpu_seconds": _stages[name].cpu, "peak_rss_bytes": _stages[name].peak_rss,
+                        "rss_growth_bytes": _stages[name].rss_growth}
+                       for name in names],
+            "total_wall_seconds": time.perf_counter() - _start,
+            "total_cpu_seconds": time.process_time() - _start_cpu,
+            "max_rss_bytes": max_rss()}
+
+
+def summary_table(profile: dict) -> str:
+    """Formats a report as a table with one line per stage.
+            Parameters
+            ----------
+                profile : dict, required
+                    The report from report().
+            Returns
+            -------
+                str
+                    The table, with a line for the time spent outside the stages (mostly imports) and a total line.
+    """
+    lines: List[str] = [f'{"stage":<16}{"calls":>7}{"wall s":>10}{"cpu s":>10}{"peak RSS MiB":>14}{"+MiB":>8}']
+    for row in profile["stages"]:
+        lines.append(f'{row["stage"]:<16}{row["calls"]:>7}{row["wall_seconds"]:>10.3f}{row["cpu_seconds"]:>10.3f}'
+                     f'{row["peak_rss_bytes"] / 2 ** 20:>14.1f}{row["rss_growth_bytes"] / 2 ** 20:>8.1f}')
+    staged: float = sum(row["wall_seconds"] for row in profile["stages"])
+    lines.append(f'{"(other)":<16}{"":>7}{profile["total_wall_seconds"] - staged:>10.3f}')
+    lines.append(f'{"total":<16}{"":>7}{profile["total_wall_seconds"]:>10.3f}{profile["total_cpu_seconds"]:>10.3f}')
+    if profile["max_rss_bytes"] != None:
+        lines.append(f'peak RSS: {profile["max_rss_bytes"] / 2 ** 20:.1f} MiB')
+    return "\n".join(lines)
+
+
+def write_json(profile: dict, file_name: str) -> None:
+    """Writes a report to a json file, or to stdout if file_name is -."""
+    if file_name == "-":
+        json.dump(profile, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        return
+    with open(file_name, "w") as file_out:
+        json.dump(profile, file_out, indent=2)
@@ -7,7 +7,8 @@ Created on Tuesday March 26 2024
 @SID: V00974267
 """
 
-from typing import IO, Union
+import itertools
+from typing import IO, Iterable, Iterator, List, Optional, Union
 
 from typing import NamedTuple
 
@@ -31,6 +32,7 @@ class CircleShape:
             op: float
                 opacity of the shapes color
     """
+    __slots__ = ("cx", "cy", "rad", "red", "green", "blue", "op")
 
     def __init__(self, cx: int, cy: int, rad: int, red: int, gre: int, blu: int, op: float):
         """Constructor for RectangleShape class
@@ -96,8 +98,9 @@ class RectangleShape:
             op: float
                 opacity of the shapes color
     """
-                
-    def __intit__(elf, x: int, y: int, width: int, height: int, red: int, gre: int, blu: int, op: float):
+    __slots__ = ("xpos", "ypos", "width", "height", "red", "green", "blue", "op")
+
+    def __init__(self, x: int, y: int, width: int, height: int, red: int, gre: int, blu: int, op: float):
         """Constructor for RectangleShape class
             Parameters
             ----------
@@ -151,9 +154,12 @@ class HtmlDocument:
                 Title of the art
             file: IO
                 The file to write to
+            buffered: bool
+                True to gather the appended lines and write them to the file BUFFER_LINES lines at a time
         """
     TAB: str = "   "
-    def __init__(self, file_name: str, title: str):
+    BUFFER_LINES: int = 4096
+    def __init__(self, file_name: str, title: str, buffered: bool = False):
         """Constructor for SvgCanvas class
             Parameters
             ----------
@@ -161,12 +167,16 @@ class HtmlDocument:
                     Name of the file to write to
                 title: str
                     Title of the art
+                buffered: bool
+                    True to write the file in large blocks instead of a line at a time
             Returns
             -------
                 None
         """
         self.title: str = title
         self.__tabs: int = 0
+        self.__indent: str = ""
+        self.__buffer: Optional[List[str]] = [] if buffered else None
         self.__file: IO = open(file_name, "w")
         self.__write_head()
 
@@ -180,6 +190,7 @@ class HtmlDocument:
                 None
         """
         self.__tabs += 1
+        self.__indent = HtmlDocument.TAB * self.__tabs
 
     def decrease_indent(self) -> None:
         """Decreases the number of tabs by one
@@ -191,6 +202,7 @@ class HtmlDocument:
                 None
         """
         self.__tabs -= 1
+        self.__indent = HtmlDocument.TAB * self.__tabs
 
     def append(self, content: str) -> None:
         """Appends a string to the document
@@ -202,8 +214,45 @@ class HtmlDocument:
             -------
                 None
         """
-        ts: str = HtmlDocument.TAB * self.__tabs
-        self.__file.write(f'{ts}{content}\n')
+        line: str = f'{self.__indent}{content}\n'
+        if self.__buffer == None:
+            self.__file.write(line)
+            return
+        self.__buffer.append(line)
+        if len(self.__buffer) >= HtmlDocument.BUFFER_LINES:
+            self.flush()
+
+    def append_many(self, contents: Iterable[str]) -> None:
+        """Appends strings to the document, one per line at the current indent. Every BUFFER_LINES strings are joined
+        into one block and written at once, so the indent and the write are not paid for each line.
+            Parameters
+            ----------
+                contents: Iterable[str]
+                    The strings to append, e.g. the svg strings of shapes
+            Returns
+            -------
+                None
+        """
+        self.flush()
+        separator: str = f'\n{self.__indent}'
+        iterator: Iterable[str] = iter(contents)
+        chunk: List[str] = list(itertools.islice(iterator, HtmlDocument.BUFFER_LINES))
+        while chunk:
+            self.__file.write(f'{self.__indent}{separator.join(chunk)}\n')
+            chunk = list(itertools.islice(iterator, HtmlDocument.BUFFER_LINES))
+
+    def flush(self) -> None:
+        """Writes the buffered lines to the file
+            Parameters
+            ----------
+                None
+            Returns
+            -------
+                None
+        """
+        if self.__buffer:
+            self.__file.write("".join(self.__buffer))
+            self.__buffer.clear()
 
     def __write_head(self) -> None:
         """Writes the head of the html code to the document
@@ -245,6 +294,7 @@ class HtmlDocument:
         """
         self.append('</body>')
         self.append('</html>')
+        self.flush()
         self.__file.close()
 
 class SvgCanvas:
@@ -259,6 +309,7 @@ class SvgCanvas:
                 List of the shapes that will populate the canvas
     """
     TAB: str = "   "
+    BATCH_LINES: int = 4096
 
     def __init__(self, width: int, height: int):
         """Constructor for SvgCanvas class
@@ -289,7 +340,7 @@ class SvgCanvas:
         self.shapes.append(shape)
 
     def gen_art(self) -> str:
-        """Generates an SVG string
+        """Generates an SVG string, joining the lines of gen_lines once
             Parameters
             ----------
                 None
@@ -298,10 +349,40 @@ class SvgCanvas:
                 str
                     SVG string generated
         """
-        svg_content: str = ""
+        return "\n".join(self.gen_lines())
+
+    def gen_lines(self) -> Iterator[str]:
+        """Generates the lines of the SVG string one at a time, rendering each shape only when its line is needed
+            Parameters
+            ----------
+                None
+            Returns
+            -------
+                Iterator[str]
+                    The opening svg tag, the SVG string of each shape and the closing svg tag
+        """
+        yield f"<svg width=\"{self.width}\" height=\"{self.height}\">"
         for shape in self.shapes:
-            svg_content += shape.svg_render() + "\n"
-        return f"<svg width=\"{self.width}\" height=\"{self.height}\">\n{svg_content}{SvgCanvas.TAB}</svg>"
+            yield shape.svg_render()
+        yield f"{SvgCanvas.TAB}</svg>"
+
+    def write_art(self, target: IO) -> None:
+        """Writes the SVG string of gen_art to a writable target, BATCH_LINES lines at a time, so the whole string
+        is never held in memory
+            Parameters
+            ----------
+                target: IO
+                    Anything with a write method taking a str, e.g. a file, an io.StringIO or socket.makefile("w")
+            Returns
+            -------
+                None
+        """
+        lines: Iterator[str] = self.gen_lines()
+        target.write(next(lines))
+        chunk: List[str] = list(itertools.islice(lines, SvgCanvas.BATCH_LINES))
+        while chunk:
+            target.write("\n" + "\n".join(chunk))
+            chunk = list(itertools.islice(lines, SvgCanvas.BATCH_LINES))
 
 def make_canvas() -> SvgCanvas:
     """Makes a SvgCanvas and populates it
@@ -340,11 +421,13 @@ def make_file(canvas: SvgCanvas, filename: str) -> None:
             None
                
     """
-    doc: HtmlDocument = HtmlDocument(filename, "My Art")
+    doc: HtmlDocument = HtmlDocument(filename, "My Art", buffered=True)
     doc.increase_indent()
     doc._HtmlDocument__write_comment("Define SVG drawing box")
-    doc.append(canvas.gen_art())
+    lines: Iterator[str] = canvas.gen_lines()
+    doc.append(next(lines))
     doc.decrease_indent()
+    doc.append_many(lines)
     doc._HtmlDocument__write_tail()
 
 
@@ -7,9 +7,14 @@ Created on Tuesday March 26 2024
 @SID: V00974267
 """
 
+import argparse
+import itertools
 import random as rd
+from array import array
 from enum import Enum
-from typing import IO, List, NamedTuple
+from typing import IO, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+SVG_BATCH_SHAPES: int = 10000
 
 class ShapeKind(str, Enum):
     """ShapeKind class describing supported shape kinds
@@ -146,19 +151,35 @@ class RandomShape:
     """RandomShape class generateing a random shape specified by PyArtConfig    
         Attributes
         ----------
-            config: PyArtConfig
-                Configuration to guide the creation of the shape
             shape: List[Shapekind]
                 list of the kinds of shapes to be made
-            randpt: Tuple(int, int)
-                Cordinates for random points
+            x: int
+                x cordinate of the random point
+            y: int
+                y cordinate of the random point
             rad: int
                 Radius for circle
-            rwh: Tuple(int, int)
-                Width and height respectivly for a rectangle
-            col: Color
-                The configuration for a instance of the color class
+            width: int
+                Width for a rectangle
+            height: int
+                Height for a rectangle
+            red: int
+                The intensity of the color red
+            gre: int
+                The intensity of the color green
+            blu: int
+                The intensity of the color blue
+            op: float
+                The opacity of the shapes color
+            randpt: Tuple[int, int]
+                Cordinates for random points, a view of x and y
+            rwh: Tuple[int, int]
+                Width and height respectivly for a rectangle, a view of width and height
+            col: Tuple[int, int, int, float]
+                The color of the shape, a view of red, gre, blu and op
     """
+    __slots__ = ("shape", "x", "y", "rad", "width", "height", "red", "gre", "blu", "op")
+
     def __init__(self, config: PyArtConfig) -> None:
         """Constructor for RectangleShape class
             Parameters
@@ -169,12 +190,31 @@ class RandomShape:
             -------
                 None
         """
-        self.config: PyArtConfig = config
         self.shape: List[ShapeKind] = rd.choice(config.SHAPES)
-        self.randpt: Tuple(int, int) = (gen_int(config.CAN.width), gen_int(config.CAN.height))
+        self.x: int = gen_int(config.CAN.width)
+        self.y: int = gen_int(config.CAN.height)
         self.rad: int = gen_int(config.RAD)
-        self.rwh: Tuple(int, int) = (gen_int(config.RWH.width), gen_int(config.RWH.height))
-        self.col: Color = (gen_int(config.COL.red), gen_int(config.COL.green), gen_int(config.COL.blue), gen_float(config.COL.opacity))
+        self.width: int = gen_int(config.RWH.width)
+        self.height: int = gen_int(config.RWH.height)
+        self.red: int = gen_int(config.COL.red)
+        self.gre: int = gen_int(config.COL.green)
+        self.blu: int = gen_int(config.COL.blue)
+        self.op: float = gen_float(config.COL.opacity)
+
+    @property
+    def randpt(self) -> Tuple[int, int]:
+        """Cordinates of the random point"""
+        return (self.x, self.y)
+
+    @property
+    def rwh(self) -> Tuple[int, int]:
+        """Width and height of the rectangle"""
+        return (self.width, self.height)
+
+    @property
+    def col(self) -> Tuple[int, int, int, float]:
+        """Color of the shape"""
+        return (self.red, self.gre, self.blu, self.op)
 
 class CircleShape:
     """A CircleShape class representing an SVG circle element
@@ -197,7 +237,9 @@ class CircleShape:
             op: float
                 The opacity of the shapes color
     """
+    __slots__ = ("sha", "centx", "centy", "rad", "red", "gre", "blu", "op")
     circle_count: int = 0
+    SVG: str = '<circle cx="{}" cy="{}" r="{}" fill ="rgb({},{},{})" fill-opacity="{}"></circle>'
 
     @classmethod
     def get_circle_count(cls) -> int:
@@ -214,13 +256,13 @@ class CircleShape:
                 None
         """
         self.sha: int = 0
-        self.centx: int = rs.randpt[0]
-        self.centy: int = rs.randpt[1]
+        self.centx: int = rs.x
+        self.centy: int = rs.y
         self.rad: int = rs.rad
-        self.red: int = rs.col[0]
-        self.gre: int = rs.col[1]
-        self.blu: int = rs.col[2]
-        self.op: float = rs.col[3]
+        self.red: int = rs.red
+        self.gre: int = rs.gre
+        self.blu: int = rs.blu
+        self.op: float = rs.op
 
     def as_svg(self) -> str:
         """Svg string representation of a shape
@@ -232,9 +274,7 @@ class CircleShape:
                 str
                     The svg string
          """
-        return f'<circle cx="{self.centx}" cy="{self.centy}" r="{self.rad}" ' \
-               f'fill ="rgb({self.red},{self.gre},{self.blu})" ' \
-               f'fill-opacity="{self.op}"></circle>'
+        return CircleShape.SVG.format(self.centx, self.centy, self.rad, self.red, self.gre, self.blu, self.op)
 
     def __str__(self) -> str:
         """String representation of a shape
@@ -276,7 +316,9 @@ class RectangleShape:
             op: float
                 The opacity of the shapes color
     """
+    __slots__ = ("sha", "xpos", "ypos", "width", "height", "red", "gre", "blu", "op")
     rect_count: int = 1
+    SVG: str = '<rect x="{}" y="{}" width="{}" height="{}" fill="rgb({},{},{})" fill-opacity="{}"></rect>'
 
     @classmethod
     def get_rect_count(cls) -> int:
@@ -294,14 +336,14 @@ class RectangleShape:
                 None
         """
         self.sha: int = 1
-        self.xpos: int = rs.randpt[0]
-        self.ypos: int = rs.randpt[1]
-        self.width: int = rs.rwh[0]
-        self.height: int = rs.rwh[1]
-        self.red: int = rs.col[0]
-        self.gre: int = rs.col[1]
-        self.blu: int = rs.col[2]
-        self.op: float = rs.col[3]
+        self.xpos: int = rs.x
+        self.ypos: int = rs.y
+        self.width: int = rs.width
+        self.height: int = rs.height
+        self.red: int = rs.red
+        self.gre: int = rs.gre
+        self.blu: int = rs.blu
+        self.op: float = rs.op
 
     def as_svg(self) -> str:
         """Svg string representation of a shape
@@ -313,9 +355,7 @@ class RectangleShape:
                 str
                     The svg string
          """
-        return f'<rect x="{self.xpos}" y="{self.ypos}" width="{self.width}" ' \
-               f'height="{self.height}" fill="rgb({self.red},{self.gre},{self.blu})" ' \
-               f'fill-opacity="{self.op}"></rect>'
+        return RectangleShape.SVG.format(self.xpos, self.ypos, self.width, self.height, self.red, self.gre, self.blu, self.op)
 
 class HtmlDocument:
     """HtmlDocument Class representing an html document
@@ -325,9 +365,12 @@ class HtmlDocument:
                 Title of the art
             file: IO 
                 The file to open and write to
+            buffered: bool
+                True to gather the appended lines and write them to the file BUFFER_LINES lines at a time
     """
     TAB: str = "   "
-    def __init__(self, file_name: str, title: str):
+    BUFFER_LINES: int = 4096
+    def __init__(self, file_name: str, title: str, buffered: bool = False):
         """Constructor for the HtmlDocument class
             Parameters
             ----------
@@ -335,12 +378,16 @@ class HtmlDocument:
                     The name of the file to be made
                 title: str
                     The title of the art to be generated
+                buffered: bool
+                    True to write the file in large blocks instead of a line at a time
             Returns
             -------
                 None
          """
         self.title: str = title
         self.__tabs: int = 0
+        self.__indent: str = ""
+        self.__buffer: Optional[List[str]] = [] if buffered else None
         self.__file: IO = open(file_name, "w")
         self.__write_head()
 
@@ -354,6 +401,7 @@ class HtmlDocument:
                 None
          """
         self.__tabs += 1
+        self.__indent = HtmlDocument.TAB * self.__tabs
 
     def decrease_indent(self) -> None:
         """Decreases the number of tabs by 1
@@ -365,6 +413,7 @@ class HtmlDocument:
                 None
          """
         self.__tabs -= 1
+        self.__indent = HtmlDocument.TAB * self.__tabs
 
     def append(self, content: str) -> None:
         """Writes a string to the html file
@@ -376,8 +425,45 @@ class HtmlDocument:
             -------
                 None
          """
-        ts: str = HtmlDocument.TAB * self.__tabs
-        self.__file.write(f'{ts}{content}\n')
+        line: str = f'{self.__indent}{content}\n'
+        if self.__buffer == None:
+            self.__file.write(line)
+            return
+        self.__buffer.append(line)
+        if len(self.__buffer) >= HtmlDocument.BUFFER_LINES:
+            self.flush()
+
+    def append_many(self, contents: Iterable[str]) -> None:
+        """Appends strings to the document, one per line at the current indent. Every BUFFER_LINES strings are joined
+        into one block and written at once, so the indent and the write are not paid for each line.
+            Parameters
+            ----------
+                contents: Iterable[str]
+                    The strings to append, e.g. the svg strings of shapes
+            Returns
+            -------
+                None
+         """
+        self.flush()
+        separator: str = f'\n{self.__indent}'
+        iterator: Iterable[str] = iter(contents)
+        chunk: List[str] = list(itertools.islice(iterator, HtmlDocument.BUFFER_LINES))
+        while chunk:
+            self.__file.write(f'{self.__indent}{separator.join(chunk)}\n')
+            chunk = list(itertools.islice(iterator, HtmlDocument.BUFFER_LINES))
+
+    def flush(self) -> None:
+        """Writes the buffered lines to the file
+            Parameters
+            ----------
+                None
+            Returns
+            -------
+                None
+         """
+        if self.__buffer:
+            self.__file.write("".join(self.__buffer))
+            self.__buffer.clear()
 
     def __write_head(self) -> None:
         """Writes the head of the html file
@@ -432,6 +518,7 @@ class HtmlDocument:
          """
         self.append('</body>')
         self.append('</html>')
+        self.flush()
         self.__file.close()
 
 def make_random_shapes(config: PyArtConfig, num_shapes: int) -> List[RandomShape]:
@@ -453,43 +540,296 @@ def make_random_shapes(config: PyArtConfig, num_shapes: int) -> List[RandomShape
         shapes.append(rs)
     return shapes
 
-def make_file(config: PyArtConfig, filename: str) -> None:
-    """Makes the html file and populates it with svg string representing shapes
+class ShapeBatch(NamedTuple):
+    """ShapeBatch class holding the parameters of many random shapes as one column per parameter (a struct of arrays)
+    instead of one object per shape. Every shape draws every parameter, like RandomShape, and its kind picks the ones used.
+        Attributes
+        ----------
+            kind: Sequence[int]
+                The ShapeKind of every shape, 0 for a circle and 1 for a rectangle
+            x: Sequence[int]
+                x cordinate of the center of a circle or the corner of a rectangle
+            y: Sequence[int]
+                y cordinate of the center of a circle or the corner of a rectangle
+            rad: Sequence[int]
+                Radius of a circle
+            w: Sequence[int]
+                Width of a rectangle
+            h: Sequence[int]
+                Height of a rectangle
+            r: Sequence[int]
+                Intensity of the color red
+            g: Sequence[int]
+                Intensity of the color green
+            b: Sequence[int]
+                Intensity of the color blue
+            op: Sequence[float]
+                Opacity of the shapes color
+    """
+    kind: Sequence[int]
+    x: Sequence[int]
+    y: Sequence[int]
+    rad: Sequence[int]
+    w: Sequence[int]
+    h: Sequence[int]
+    r: Sequence[int]
+    g: Sequence[int]
+    b: Sequence[int]
+    op: Sequence[float]
+
+    def shape_count(self) -> int:
+        """Returns the number of shapes in the batch"""
+        return len(self.kind)
+
+    def part(self, start: int, stop: int) -> "ShapeBatch":
+        """Returns the shapes from start up to but not including stop as a batch"""
+        return ShapeBatch(*[column[start:stop] for column in self])
+
+def join_shape_batches(batches: List[ShapeBatch]) -> ShapeBatch:
+    """Joins batches of shapes into one batch, in order
+        Parameters
+        ----------
+            batches: List[ShapeBatch]
+                The batches to join, all NumPy arrays or all array module arrays
+        Returns
+        -------
+            ShapeBatch
+                The shapes of every batch
+     """
+    if len(batches) == 1:
+        return batches[0]
+    if isinstance(batches[0].kind, array):
+        return ShapeBatch(*[array(columns[0].typecode, itertools.chain.from_iterable(columns)) for columns in zip(*batches)])
+    import numpy as np
+    return ShapeBatch(*[np.concatenate(columns) for columns in zip(*batches)])
+
+def make_rng(seed: Optional[int] = None) -> object:
+    """Makes the random generator of the shape batches, a NumPy Generator or a random.Random without NumPy
+        Parameters
+        ----------
+            seed: Optional[int]
+                Seed of the random generator, None for different shapes every time
+        Returns
+        -------
+            object
+                The random generator
+     """
+    try:
+        import numpy as np
+    except ImportError:
+        return rd.Random(seed)
+    return np.random.default_rng(seed)
+
+def make_shape_batch(config: PyArtConfig, num_shapes: int, seed: Optional[int] = None) -> ShapeBatch:
+    """Generates the parameters of a number of random shapes at once, each parameter drawn for every shape in one NumPy
+    call into a contiguous array. Without NumPy the columns are array module arrays filled one value at a time.
+        Parameters
+        ----------
+            config: PyArtConfig
+                Configuration to guide the shapes generation
+            num_shapes: int
+                Number of shapes to generate
+            seed: Optional[int]
+                Seed of the random generator, None for a different batch every time
+        Returns
+        -------
+            ShapeBatch
+                The parameters of the shapes
+     """
+    return draw_shape_batch(config, num_shapes, make_rng(seed))
+
+def draw_shape_batch(config: PyArtConfig, num_shapes: int, rng: object) -> ShapeBatch:
+    """Generates the parameters of a number of random shapes from a random generator made by make_rng
+        Parameters
+        ----------
+            config: PyArtConfig
+                Configuration to guide the shapes generation
+            num_shapes: int
+                Number of shapes to generate
+            rng: object
+                The random generator, its state carries on to the next batch drawn from it
+        Returns
+        -------
+            ShapeBatch
+                The parameters of the shapes
+     """
+    if isinstance(rng, rd.Random):
+        return make_shape_batch_arrays(config, num_shapes, rng)
+    import numpy as np
+    kinds: List[int] = [int(kind.value) for kind in config.SHA]
+
+    def gen_ints(r: Irange):
+        """Generates an array of random integers from an Irange class, both ends included like gen_int"""
+        return rng.integers(r.imin, r.imax, size=num_shapes, dtype=np.int32, endpoint=True)
+
+    return ShapeBatch(np.array(kinds, dtype=np.int8)[rng.integers(0, len(kinds), size=num_shapes)],
+                      gen_ints(config.CAN.width), gen_ints(config.CAN.height), gen_ints(config.RAD),
+                      gen_ints(config.RWH.width), gen_ints(config.RWH.height),
+                      gen_ints(config.COL.red), gen_ints(config.COL.green), gen_ints(config.COL.blue),
+                      rng.uniform(config.COL.opacity.fmin, config.COL.opacity.fmax, size=num_shapes))
+
+def make_shape_batch_arrays(config: PyArtConfig, num_shapes: int, rng: rd.Random) -> ShapeBatch:
+    """Generates the parameters of a number of random shapes into array module columns, used when NumPy is not installed
+        Parameters
+        ----------
+            config: PyArtConfig
+                Configuration to guide the shapes generation
+            num_shapes: int
+                Number of shapes to generate
+            rng: rd.Random
+                The random generator to draw from
+        Returns
+        -------
+            ShapeBatch
+                The parameters of the shapes
+     """
+    kinds: List[int] = [int(kind.value) for kind in config.SHA]
+
+    def gen_ints(r: Irange) -> array:
+        """Generates an array of random integers from an Irange class"""
+        return array("i", [rng.randint(r.imin, r.imax) for _ in range(num_shapes)])
+
+    return ShapeBatch(array("b", [rng.choice(kinds) for _ in range(num_shapes)]),
+                      gen_ints(config.CAN.width), gen_ints(config.CAN.height), gen_ints(config.RAD),
+                      gen_ints(config.RWH.width), gen_ints(config.RWH.height),
+                      gen_ints(config.COL.red), gen_ints(config.COL.green), gen_ints(config.COL.blue),
+                      array("d", [rng.uniform(config.COL.opacity.fmin, config.COL.opacity.fmax) for _ in range(num_shapes)]))
+
+def gen_shape_batches(config: PyArtConfig, num_shapes: int, batch_size: int = SVG_BATCH_SHAPES, seed: Optional[int] = None) -> Iterator[ShapeBatch]:
+    """Generates random shapes in batches, so only one batch of shapes exists at a time however many shapes there are.
+    The shapes are always drawn SVG_BATCH_SHAPES at a time and then cut into batches, so a seed gives the same shapes
+    whatever the batch size.
+        Parameters
+        ----------
+            config: PyArtConfig
+                Configuration to guide the shapes generation
+            num_shapes: int
+                Number of shapes to generate
+            batch_size: int
+                Number of shapes in every batch but the last
+            seed: Optional[int]
+                Seed of the random generator, None for different shapes every time
+        Returns
+        -------
+            Iterator[ShapeBatch]
+                The batches of shapes
+     """
+    rng: object = make_rng(seed)
+    pending: List[ShapeBatch] = []
+    pending_shapes: int = 0
+    for start in range(0, num_shapes, SVG_BATCH_SHAPES):
+        pending.append(draw_shape_batch(config, min(SVG_BATCH_SHAPES, num_shapes - start), rng))
+        pending_shapes += pending[-1].shape_count()
+        if pending_shapes < batch_size:
+            continue
+        drawn: ShapeBatch = join_shape_batches(pending)
+        cut: int = pending_shapes - pending_shapes % batch_size
+        for begin in range(0, cut, batch_size):
+            yield drawn.part(begin, begin + batch_size)
+        pending = [drawn.part(cut, pending_shapes)]
+        pending_shapes -= cut
+    if pending_shapes > 0:
+        yield join_shape_batches(pending)
+
+def batch_svg(batch: ShapeBatch) -> List[str]:
+    """Svg string representations of the shapes of a batch, the same strings as_svg makes for each shape
+        Parameters
+        ----------
+            batch: ShapeBatch
+                The shapes
+        Returns
+        -------
+            List[str]
+                The svg strings in the order of the shapes
+     """
+    circle: str = CircleShape.SVG
+    rect: str = RectangleShape.SVG
+    return [circle.format(x, y, rad, r, g, b, op) if kind == 0 else rect.format(x, y, w, h, r, g, b, op)
+            for kind, x, y, rad, w, h, r, g, b, op in zip(*[column.tolist() for column in batch])]
+
+def gen_svg(config: PyArtConfig, num_shapes: int, batch_size: int = SVG_BATCH_SHAPES, seed: Optional[int] = None) -> Iterator[List[str]]:
+    """Generates the svg strings of random shapes a batch at a time
+        Parameters
+        ----------
+            config: PyArtConfig
+                Configuration to guide the shapes generation
+            num_shapes: int
+                Number of shapes to generate
+            batch_size: int
+                Number of shapes in every batch but the last
+            seed: Optional[int]
+                Seed of the random generator, None for different shapes every time
+        Returns
+        -------
+            Iterator[List[str]]
+                The svg strings of every batch
+     """
+    for batch in gen_shape_batches(config, num_shapes, batch_size, seed):
+        yield batch_svg(batch)
+
+def make_file(config: PyArtConfig, filename: str, num_shapes: Optional[int] = None, batch_size: int = SVG_BATCH_SHAPES,
+              seed: Optional[int] = None) -> None:
+    """Makes the html file and populates it with svg string representing shapes.
+    The shapes are generated, turned into svg strings and written a batch at a time, so memory use does not grow with
+    the number of shapes.
         Parameters
         ----------
             config: PyArtConfig
                 Configuration to guide the shapes generation
             filename: str
                 Name of the file to write to
+            num_shapes: Optional[int]
+                Number of shapes to generate, None for a random number from 1 to 10000 drawn with seed
+            batch_size: int
+                Number of shapes generated and written at a time
+            seed: Optional[int]
+                Seed of the random generator, None for different shapes every time
         Returns
         -------
             None
      """
-    num_shapes = rd.randint(1, 10000)
-    shapes = make_random_shapes(config, num_shapes)
-    html_doc: HtmlDocument = HtmlDocument(filename, "Random Shapes")
+    if num_shapes == None:
+        num_shapes = rd.Random(seed).randint(1, 10000)
+    html_doc: HtmlDocument = HtmlDocument(filename, "Random Shapes", buffered=True)
     html_doc.open_svg_scope(config.CAN_RANGES)
     html_doc.increase_indent()
     html_doc.increase_indent()
 
-    for rs in shapes:
-        if rs.shape == ShapeKind.CIRCLE:
-            shape = CircleShape(rs)
-            html_doc.append(shape.as_svg())
-
-        elif rs.shape == ShapeKind.RECTANGLE:
-            shape = RectangleShape(rs)
-            html_doc.append(shape.as_svg())
+    for svgs in gen_svg(config, num_shapes, batch_size, seed):
+        html_doc.append_many(svgs)
 
     html_doc.decrease_indent()
     html_doc.append("</svg>")
     html_doc.decrease_indent()
     html_doc.write_tail()
 
+def parse_command_line_args() -> argparse.Namespace:
+    """Parse command line arguments.
+        Parameters
+        ----------
+            None
+        Returns
+        -------
+            argparse.Namespace
+                The Arguements from the command line and their values.
+    """
+    parser = argparse.ArgumentParser(description='Generate random art as an html file')
+    parser.add_argument('--file', default='a433.html', help='html file to write')
+    parser.add_argument('--shapes', type=int, help='number of shapes to draw (default: a random number from 1 to 10000)')
+    parser.add_argument('--batch_size', type=int, default=SVG_BATCH_SHAPES, help=f'shapes generated and written at a time (default: {SVG_BATCH_SHAPES})')
+    parser.add_argument('--seed', type=int, help='seed of the random generator, the same seed draws the same art whatever --batch_size')
+    args: argparse.Namespace = parser.parse_args()
+    if args.shapes != None and args.shapes < 0:
+        parser.error('--shapes must be 0 or more')
+    if args.batch_size < 1:
+        parser.error('--batch_size must be 1 or more')
+    return args
+
 def main() -> None:
     """Main entry point for the program"""
+    args: argparse.Namespace = parse_command_line_args()
     config: PyArtConfig = PyArtConfig()
-    make_file(config, "a433.html")
+    make_file(config, args.file, args.shapes, args.batch_size, args.seed)
 
 if __name__ == "__main__":
     main()
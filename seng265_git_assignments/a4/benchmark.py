@@ -0,0 +1,391 @@
+#!/usr/bin/env python
+
+"""
+Benchmarks for Assingmnet 4
+Sample input: --shapes="1000000"
+Run from the a4 directory, the parts are imported as a41.a41 and a43.image_generator
+@Author: Wesley Ducharme
+@SID: V00974267
+"""
+
+import argparse
+import os
+import random as rd
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, List, Tuple
+
+from a41 import a41
+from a43 import image_generator as ig
+
+def parse_command_line_args() -> argparse.Namespace:
+    """Parse command line arguments.
+        Parameters
+        ----------
+            None
+        Returns
+        -------
+            argparse.Namespace
+                The Arguements from the command line and their values.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the shape generation and rendering of assignment 4')
+    parser.add_argument('--shapes', type=int, default=1000000, help='number of shapes to benchmark on')
+    return parser.parse_args()
+
+def shapes_per_second(function: Callable[[], object], num_shapes: int) -> float:
+    """Times one call of a function that makes a number of shapes
+        Parameters
+        ----------
+            function: Callable[[], object]
+                The function to time
+            num_shapes: int
+                Number of shapes the function makes
+        Returns
+        -------
+            float
+                The shapes made per second
+     """
+    start: float = time.perf_counter()
+    function()
+    return num_shapes / (time.perf_counter() - start)
+
+def make_shape_objects(config: ig.PyArtConfig, num_shapes: int) -> List[object]:
+    """The per object path of make_file, one RandomShape and one CircleShape or RectangleShape per shape
+        Parameters
+        ----------
+            config: ig.PyArtConfig
+                Configuration to guide the shapes generation
+            num_shapes: int
+                Number of shapes to generate
+        Returns
+        -------
+            List[object]
+                The shapes
+     """
+    return [ig.CircleShape(rs) if rs.shape == ig.ShapeKind.CIRCLE else ig.RectangleShape(rs) for rs in ig.make_random_shapes(config, num_shapes)]
+
+def benchmark_shape_generation(config: ig.PyArtConfig, num_shapes: int) -> None:
+    """Compares making the shapes one object at a time with making a ShapeBatch
+        Parameters
+        ----------
+            config: ig.PyArtConfig
+                Configuration to guide the shapes generation
+            num_shapes: int
+                Number of shapes to generate
+        Returns
+        -------
+            None
+     """
+    per_object: float = shapes_per_second(lambda: make_shape_objects(config, num_shapes), num_shapes)
+    arrays: float = shapes_per_second(lambda: ig.make_shape_batch_arrays(config, num_shapes, rd.Random(265)), num_shapes)
+    batch: float = shapes_per_second(lambda: ig.make_shape_batch(config, num_shapes, 265), num_shapes)
+    print(f'shape generation, {num_shapes:,} shapes')
+    print(f'    per object:        {per_object:>14,.0f} shapes/s')
+    print(f'    array module batch:{arrays:>14,.0f} shapes/s ({arrays / per_object:.1f}x)')
+    print(f'    NumPy batch:       {batch:>14,.0f} shapes/s ({batch / per_object:.1f}x)')
+
+def peak_memory(function: Callable[[], object]) -> Tuple[float, int]:
+    """Times one call of a function and traces the peak of the memory it allocates
+        Parameters
+        ----------
+            function: Callable[[], object]
+                The function to run
+        Returns
+        -------
+            Tuple[float, int]
+                The seconds the call took and its peak traced memory in bytes
+     """
+    tracemalloc.start()
+    start: float = time.perf_counter()
+    function()
+    seconds: float = time.perf_counter() - start
+    peak: int = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak
+
+def make_file_from_list(config: ig.PyArtConfig, filename: str, num_shapes: int) -> None:
+    """The make_file of before the svg streaming, every shape is made before any is written
+        Parameters
+        ----------
+            config: ig.PyArtConfig
+                Configuration to guide the shapes generation
+            filename: str
+                Name of the file to write to
+            num_shapes: int
+                Number of shapes to generate
+        Returns
+        -------
+            None
+     """
+    shapes: List[object] = make_shape_objects(config, num_shapes)
+    html_doc: ig.HtmlDocument = ig.HtmlDocument(filename, "Random Shapes")
+    html_doc.open_svg_scope(config.CAN_RANGES)
+    html_doc.increase_indent()
+    html_doc.increase_indent()
+    for shape in shapes:
+        html_doc.append(shape.as_svg())
+    html_doc.decrease_indent()
+    html_doc.append("</svg>")
+    html_doc.decrease_indent()
+    html_doc.write_tail()
+
+def benchmark_svg_streaming(config: ig.PyArtConfig, num_shapes: int) -> None:
+    """Compares the time and peak traced memory of writing an html file from a list of shapes and streaming it in batches
+        Parameters
+        ----------
+            config: ig.PyArtConfig
+                Configuration to guide the shapes generation
+            num_shapes: int
+                Number of shapes to write
+        Returns
+        -------
+            None
+     """
+    with tempfile.TemporaryDirectory() as directory:
+        filename: str = os.path.join(directory, "shapes.html")
+        print(f'html file, {num_shapes:,} shapes (traced)')
+        for name, function in [("shape list", lambda: make_file_from_list(config, filename, num_shapes)),
+                               ("streamed batches", lambda: ig.make_file(config, filename, num_shapes, seed=265))]:
+            seconds, peak = peak_memory(function)
+            print(f'    {name + ":":<20}{seconds:>8.2f} s, peak {peak / 2 ** 20:>8.1f} MiB, '
+                  f'file {os.path.getsize(filename) / 2 ** 20:.1f} MiB')
+
+def write_html(document_class: type, filename: str, svgs: List[str], buffered: bool, many: bool) -> None:
+    """Writes svg strings to an html file with an HtmlDocument
+        Parameters
+        ----------
+            document_class: type
+                a41.HtmlDocument or ig.HtmlDocument
+            filename: str
+                Name of the file to write to
+            svgs: List[str]
+                The svg strings to write
+            buffered: bool
+                True to write in buffered mode
+            many: bool
+                True to write the strings with one append_many call instead of one append per string
+        Returns
+        -------
+            None
+     """
+    doc = document_class(filename, "Benchmark", buffered=buffered)
+    doc.increase_indent()
+    doc.increase_indent()
+    if many:
+        doc.append_many(svgs)
+    else:
+        for svg in svgs:
+            doc.append(svg)
+    doc.decrease_indent()
+    doc.decrease_indent()
+    if document_class == a41.HtmlDocument:
+        doc._HtmlDocument__write_tail()  #a41 keeps its tail private, a41.make_file calls it the same way
+    else:
+        doc.write_tail()
+
+def benchmark_html_writes(config: ig.PyArtConfig, num_shapes: int) -> None:
+    """Compares appending svg strings to the HtmlDocument of each part one at a time, buffered and with append_many
+        Parameters
+        ----------
+            config: ig.PyArtConfig
+                Configuration to guide the shapes generation
+            num_shapes: int
+                Number of svg strings to write
+        Returns
+        -------
+            None
+     """
+    svgs: List[str] = ig.batch_svg(ig.make_shape_batch(config, num_shapes, 265))
+    with tempfile.TemporaryDirectory() as directory:
+        filename: str = os.path.join(directory, "shapes.html")
+        for document_class, part in [(a41.HtmlDocument, "a41"), (ig.HtmlDocument, "a43")]:
+            print(f'{part} HtmlDocument, {num_shapes:,} elements')
+            base: float = 0.0
+            for name, buffered, many in [("append", False, False), ("buffered append", True, False),
+                                         ("buffered append_many", True, True)]:
+                if os.path.exists(filename):
+                    os.remove(filename)  #not timing the truncation of the last file
+                rate: float = shapes_per_second(lambda: write_html(document_class, filename, svgs, buffered, many), num_shapes)
+                base = base or rate
+                print(f'    {name + ":":<24}{rate:>14,.0f} elements/s ({rate / base:.1f}x)')
+
+def make_canvas(config: ig.PyArtConfig, num_shapes: int) -> a41.SvgCanvas:
+    """Makes an a41 SvgCanvas of random circles and rectangles
+        Parameters
+        ----------
+            config: ig.PyArtConfig
+                Configuration to guide the shapes generation
+            num_shapes: int
+                Number of shapes to add
+        Returns
+        -------
+            a41.SvgCanvas
+                The canvas
+     """
+    batch: ig.ShapeBatch = ig.make_shape_batch(config, num_shapes, 265)
+    canvas: a41.SvgCanvas = a41.SvgCanvas(config.CAN_RANGES.width.imax, config.CAN_RANGES.height.imax)
+    for kind, x, y, rad, w, h, r, g, b, op in zip(*[column.tolist() for column in batch]):
+        canvas.add_shape(a41.CircleShape(x, y, rad, r, g, b, op) if kind == 0 else a41.RectangleShape(x, y, w, h, r, g, b, op))
+    return canvas
+
+def gen_art_concat(canvas: a41.SvgCanvas) -> str:
+    """The SvgCanvas.gen_art of before the join, one string concatenation per shape
+        Parameters
+        ----------
+            canvas: a41.SvgCanvas
+                The canvas to render
+        Returns
+        -------
+            str
+                The SVG string
+     """
+    svg_content: str = ""
+    for shape in canvas.shapes:
+        svg_content += shape.svg_render() + "\n"
+    return f"<svg width=\"{canvas.width}\" height=\"{canvas.height}\">\n{svg_content}{a41.SvgCanvas.TAB}</svg>"
+
+def write_art_file(canvas: a41.SvgCanvas, filename: str) -> None:
+    """Streams the SVG string of a canvas to a file with SvgCanvas.write_art
+        Parameters
+        ----------
+            canvas: a41.SvgCanvas
+                The canvas to render
+            filename: str
+                Name of the file to write to
+        Returns
+        -------
+            None
+     """
+    with open(filename, "w") as file:
+        canvas.write_art(file)
+
+def benchmark_gen_art(config: ig.PyArtConfig, num_shapes: int) -> None:
+    """Compares the time and peak traced memory of rendering an a41 SvgCanvas by concatenation, by join and streamed
+        Parameters
+        ----------
+            config: ig.PyArtConfig
+                Configuration to guide the shapes generation
+            num_shapes: int
+                Number of shapes on the canvas
+        Returns
+        -------
+            None
+     """
+    canvas: a41.SvgCanvas = make_canvas(config, num_shapes)
+    with tempfile.TemporaryDirectory() as directory:
+        filename: str = os.path.join(directory, "art.svg")
+        print(f'a41 SvgCanvas rendering, {num_shapes:,} shapes (traced)')
+        for name, function in [("concatenation", lambda: gen_art_concat(canvas)), ("gen_art join", canvas.gen_art),
+                               ("write_art to a file", lambda: write_art_file(canvas, filename))]:
+            seconds, peak = peak_memory(function)
+            print(f'    {name + ":":<24}{seconds:>8.2f} s, peak {peak / 2 ** 20:>8.1f} MiB')
+
+def dict_class(shape_class: type) -> type:
+    """A copy of a shape class without its __slots__, storing its attributes in a __dict__ per instance as before
+        Parameters
+        ----------
+            shape_class: type
+                The shape class
+        Returns
+        -------
+            type
+                A class with the constructor of shape_class and no __slots__
+     """
+    return type(shape_class.__name__, (), {"__init__": shape_class.__init__})
+
+class DictRandomShape:
+    """The RandomShape of before the __slots__, with a __dict__ and its point, size and color in tuples
+        Attributes
+        ----------
+            config: ig.PyArtConfig
+                Configuration to guide the creation of the shape
+            shape: ig.ShapeKind
+                The kind of the shape
+            randpt: Tuple[int, int]
+                Cordinates for random points
+            rad: int
+                Radius for circle
+            rwh: Tuple[int, int]
+                Width and height respectivly for a rectangle
+            col: Tuple[int, int, int, float]
+                The color of the shape
+    """
+    def __init__(self, config: ig.PyArtConfig) -> None:
+        """Constructor for DictRandomShape class
+            Parameters
+            ----------
+                config: ig.PyArtConfig
+                    Configuration to guide the creation of the shape
+            Returns
+            -------
+                None
+        """
+        self.config: ig.PyArtConfig = config
+        self.shape: ig.ShapeKind = rd.choice(config.SHAPES)
+        self.randpt: Tuple[int, int] = (ig.gen_int(config.CAN.width), ig.gen_int(config.CAN.height))
+        self.rad: int = ig.gen_int(config.RAD)
+        self.rwh: Tuple[int, int] = (ig.gen_int(config.RWH.width), ig.gen_int(config.RWH.height))
+        self.col: Tuple[int, int, int, float] = (ig.gen_int(config.COL.red), ig.gen_int(config.COL.green),
+                                                 ig.gen_int(config.COL.blue), ig.gen_float(config.COL.opacity))
+
+def bytes_per_object(function: Callable[[], List[object]], num_objects: int) -> float:
+    """Traces the memory held by the objects made by a function, the values they share with existing objects excepted
+        Parameters
+        ----------
+            function: Callable[[], List[object]]
+                The function making the objects
+            num_objects: int
+                Number of objects the function makes
+        Returns
+        -------
+            float
+                The bytes held per object, including its pointer in the list
+     """
+    tracemalloc.start()
+    objects: List[object] = function()
+    size: int = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objects
+    return size / num_objects
+
+def benchmark_shape_memory(config: ig.PyArtConfig, num_shapes: int) -> None:
+    """Compares the memory per shape of the shape classes with __slots__ and with a __dict__ per instance as before
+        Parameters
+        ----------
+            config: ig.PyArtConfig
+                Configuration to guide the shapes generation
+            num_shapes: int
+                Number of shapes to make of each class
+        Returns
+        -------
+            None
+     """
+    random_shapes: List[ig.RandomShape] = ig.make_random_shapes(config, num_shapes)
+    columns: List[list] = [column.tolist() for column in ig.make_shape_batch(config, num_shapes, 265)]
+    cases: List[Tuple[str, Callable[[type], List[object]], type, type]] = [
+        ("a43 RandomShape", lambda cls: [cls(config) for _ in range(num_shapes)], DictRandomShape, ig.RandomShape),
+        ("a43 CircleShape", lambda cls: [cls(rs) for rs in random_shapes], dict_class(ig.CircleShape), ig.CircleShape),
+        ("a43 RectangleShape", lambda cls: [cls(rs) for rs in random_shapes], dict_class(ig.RectangleShape), ig.RectangleShape),
+        ("a41 CircleShape", lambda cls: [cls(x, y, rad, r, g, b, op) for _, x, y, rad, _, _, r, g, b, op in zip(*columns)],
+         dict_class(a41.CircleShape), a41.CircleShape),
+        ("a41 RectangleShape", lambda cls: [cls(x, y, w, h, r, g, b, op) for _, x, y, _, w, h, r, g, b, op in zip(*columns)],
+         dict_class(a41.RectangleShape), a41.RectangleShape)]
+    print(f'shape memory, {num_shapes:,} shapes of each class (traced)')
+    for name, make, before_class, after_class in cases:
+        before: float = bytes_per_object(lambda: make(before_class), num_shapes)
+        after: float = bytes_per_object(lambda: make(after_class), num_shapes)
+        print(f'    {name + ":":<20}__dict__ {before:>6.0f} B/shape, __slots__ {after:>6.0f} B/shape ({after / before:.0%})')
+
+def main() -> None:
+    """Main entry point for the program"""
+    args: argparse.Namespace = parse_command_line_args()
+    config: ig.PyArtConfig = ig.PyArtConfig()
+    benchmark_shape_generation(config, args.shapes)
+    benchmark_svg_streaming(config, args.shapes)
+    benchmark_html_writes(config, args.shapes)
+    benchmark_gen_art(config, args.shapes)
+    benchmark_shape_memory(config, args.shapes)
+
+if __name__ == "__main__":
+    main()